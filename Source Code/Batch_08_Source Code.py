@@ -1,225 +1,568 @@
 import argparse
+import os
+import sys
 from datetime import datetime, timedelta
 from time import sleep
 import numpy as np
-import pyaudio
+import queue
 import threading
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from pynput.mouse import Listener, Button
-import tkinter as tk
+from checkpoint import SessionCheckpoint
+from protocol import DEFAULT_PROTOCOL, compile_protocol
+from classification import SCHEMES, band_label
+from metrics import compute_metrics, from_thresholds
+from reaction_time import ReactionTimeTracker
+from session_result import EXCEL_HEADERS, SessionResult
+from live_analysis import LiveAnalysis
+from norms import SEXES, percentiles
+from reliability import StabilityTracker, repeat_statistics
+
+POLL_MS = 50  # how often the Tk main loop runs what the test thread posted
+
+
+def parse_args(argv=None):
+    """Command line options of the hearing test"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', help='Number of times each frequency is repeated (overrides the protocol)', type=int, default=None)
+    parser.add_argument('--early-stop', help='Skip remaining repeats once a frequency gives stable responses', action='store_true')
+    parser.add_argument('-p', '--protocol', help='Test protocol file (JSON, TOML or YAML)', default=DEFAULT_PROTOCOL)
+    parser.add_argument('-s', '--scheme', help='Hearing loss classification scheme', choices=sorted(SCHEMES), default='default')
+    parser.add_argument('--age', help="Patient's age for age-adjusted percentiles", type=int, default=None)
+    parser.add_argument('--sex', help="Patient's sex for age-adjusted percentiles", choices=SEXES, default='male')
+    parser.add_argument('--patient', help='Patient ID used to keep a history of retests', default=None)
+    parser.add_argument('--db', help='SQLite database every session is stored in', default='./sessions.db')
+    parser.add_argument('--parquet', help='Parquet dataset folder every finished session is also appended to', default=None)
+    parser.add_argument('--fsync-every', help='Most trials written to the checkpoint between two fsyncs', type=int, default=8)
+    parser.add_argument('--fsync-interval', help='Longest time in seconds a checkpointed trial waits for an fsync', type=float, default=10.0)
+    parser.add_argument('--restart', help='Ignore an interrupted session and start a new test', action='store_true')
+    parser.add_argument('--no-live', help='Do not show the audiogram while the test is running', action='store_true')
+    parser.add_argument('--headless', help='Run without any window: [ENTER] to respond, results rendered to files', action='store_true')
+    return parser.parse_args(argv)
 
-# Use interactive backend for displaying plots in a separate window
-plt.switch_backend('TkAgg')  # You may need to install TkAgg backend if not already installed
 
 class HearingTest:
-    def __init__(self):
+    def __init__(self, args=None):
+        self.args = args if args is not None else parse_args()
+        self.headless = self.args.headless
         self.signal = None
+        self.left_data = []
         self.right_data = []
+        self.trials = []
+        self.reaction_times = ReactionTimeTracker()
+        self.reaction_summaries = {}
+        self.live = LiveAnalysis()
+        self.stability = StabilityTracker()
+        self.ear = 'right'
         self.detected = False
         self.start_time = None
+        self.scheme = 'default'
+        self.age = None
+        self.sex = None
+        self.checkpoint = SessionCheckpoint(sync_every=self.args.fsync_every, sync_interval=self.args.fsync_interval)
+        self.live_view = None
+        self.audio = None
+        self.warming = None
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+        self.root = None
+        self.worker = None
+        self.ui_queue = queue.SimpleQueue()
 
     def display_instructions(self):
-        """Display instructions in a new window"""
-        instructions_window = tk.Tk()
-        instructions_window.title("Instructions")
-        
-        instructions_label = tk.Label(instructions_window, text="Portable Self Assessment Audiometer", font=("Arial", 16, "bold"))
+        """Display instructions in the main window"""
+        import tkinter as tk
+
+        self.root = tk.Tk()
+        self.root.title("Instructions")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        instructions_label = tk.Label(self.root, text="Portable Self Assessment Audiometer", font=("Arial", 16, "bold"))
         instructions_label.pack(padx=10, pady=10)
 
         instructions_text = "1. Put on your headphones.\n\n2. Click the left mouse button when you hear pulsing sounds.\n\n3. The test will run for the right ear, playing sounds at different frequencies and volumes.\n\n4. After each sound, click when you hear it.\n\n5. Once finished, visualizations and files will be available for review."
-        instructions_text_label = tk.Label(instructions_window, text=instructions_text, font=("Arial", 12), justify=tk.LEFT)
+        instructions_text_label = tk.Label(self.root, text=instructions_text, font=("Arial", 12), justify=tk.LEFT)
         instructions_text_label.pack(padx=10, pady=10)
 
-        start_button = tk.Button(instructions_window, text="Start Test", command=self.start_test)
-        start_button.pack(padx=10, pady=10)
+        self.start_button = tk.Button(self.root, text="Start Test", command=self.begin_test)
+        self.start_button.pack(padx=10, pady=10)
 
-        instructions_window.mainloop()
+        self.status_label = tk.Label(self.root, text="", font=("Arial", 12))
+        self.status_label.pack(padx=10, pady=10)
 
     def start_test(self):
-        """Start the hearing test"""
-        self.display_instructions()
-        self.run_test()
+        """Start the hearing test
 
-    def player(self, p, repeat=1, ear='right'):
-        """Plays sounds with different frequencies and volume levels"""
-        volumes = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90]  # Adjusted volume levels in dB
-        frequencies = [125, 250, 500, 1000, 2000, 4000, 8000]  # Adjusted frequencies in Hz
-
-        # Repeat each frequency based on the provided argument
-        frequencies = np.repeat(frequencies, repeat)
+        One Tk root runs on the main thread for the whole session; the test
+        itself runs on a worker thread and posts its windows and progress
+        back through ``post``.
+        """
+        self.start_warm_up()
+        self.display_instructions()
+        self.root.after(POLL_MS, self.poll)
+        try:
+            self.root.mainloop()
+        except KeyboardInterrupt:
+            # Let the player finish its current trial so the checkpoint stays consistent
+            self.stopped.set()
+            if self.worker:
+                self.worker.join()
+
+    def begin_test(self):
+        """Start button: runs the test on a worker thread"""
+        self.start_button.config(state="disabled")
+        self.worker = threading.Thread(target=self.run_test, daemon=True)
+        self.worker.start()
+
+    def post(self, callback, *args):
+        """Runs ``callback`` on the Tk main loop; safe from any thread, ignored without a window"""
+        if self.root is not None:
+            self.ui_queue.put((callback, args))
+
+    def poll(self):
+        """Runs the callbacks posted by the test thread, then polls again after POLL_MS"""
+        while True:
+            try:
+                callback, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+        if self.stopped.is_set() and not (self.worker and self.worker.is_alive()):
+            self.root.destroy()
+            return
+        self.root.after(POLL_MS, self.poll)
+
+    def on_close(self):
+        """Closing the main window aborts a running test (the checkpoint is kept) and quits"""
+        self.stopped.set()
+        self.set_status("Stopping the test...")
+
+    def set_status(self, text):
+        self.status_label.config(text=text)
+
+    def start_warm_up(self):
+        """Loads audio and plotting in the background while the instructions are read"""
+        if self.warming is None:
+            self.warming = threading.Thread(target=self.warm_up, daemon=True)
+            self.warming.start()
+
+    def warm_up(self):
+        """Imports pyaudio and matplotlib, opens the audio host and renders the session's audiogram templates"""
+        import pyaudio
+        import audiogram
+        from report import REPORT_DPI
+
+        self.audio = pyaudio.PyAudio()
+        # The protocol of an interrupted session wins, as in run_test
+        state = None if self.args.restart else SessionCheckpoint.load(self.checkpoint.path)
+        protocol = (state and state['protocol']) or self.args.protocol
+        try:
+            audiogram.warm_up(protocol, dpis=(100, REPORT_DPI))
+        except (ValueError, OSError):
+            pass  # a missing or invalid protocol is reported by run_test
+
+    def player(self, p, schedule, ear='right', start=(0, 0)):
+        """Plays sounds with different frequencies and volume levels
+
+        The frequencies, volumes and pauses come from the compiled protocol
+        ``schedule``. ``start`` is the (frequency step, volume level) to begin
+        from when resuming an interrupted session.
+        """
+        import pyaudio
 
         stream = p.open(format=pyaudio.paFloat32,
-                        channels=1,
-                        rate=44100,
+                        channels=schedule.channels,
+                        rate=schedule.sample_rate,
                         output=True)
 
         sleep(0.1)
-        for freq in frequencies:
+        position = start if start[0] < len(schedule) else None
+        while position is not None and not self.stopped.is_set():
+            step, level = position
+            freq, vol = int(schedule.frequencies[step]), int(schedule.volumes[level])
             self.detected = False
-            for vol in volumes:
-                print(f"Playing frequency: {freq} Hz at volume: {vol} dB for {ear} ear")
-                self.signal = [freq, vol, datetime.now()]
-                audio_data = (np.sin(2 * np.pi * np.arange(44100 * 0.5) * freq / 44100)).astype(np.float32)
-                audio_data = audio_data * 10**(vol / 20)
-                stream.write(audio_data.tobytes())
-                sleep(2)  # Adding 2-second pause after playing each volume level
-                if self.detected:
-                    break
-            sleep(2)  # Adding 2-second pause after playing each frequency
+            print(f"Playing frequency: {freq} Hz at volume: {vol} dB for {ear} ear")
+            self.signal = [freq, vol, datetime.now()]
+            self.post(self.set_status, f"Testing {ear} ear: {freq} Hz at {vol} dB")
+            if self.live_view:
+                self.live_view.show_tone(freq, vol)
+            stream.write(schedule.audio(ear, step, level).tobytes())
+            sleep(schedule.level_pause)  # Pause after playing each volume level
+            heard = self.ear_data(ear)[-1][3] if self.detected else None
+            self.checkpoint.record_trial(ear, step, level, freq, vol, self.signal[2], heard)
+            self.trials.append([ear, step, freq, vol, self.signal[2], heard])
+            threshold, flag = self.live.update(ear, freq, vol, self.detected)
+            position = schedule.next_position(step, level, self.detected)
+            if self.detected and schedule.early_stop and self.stability.add(ear, freq, vol):
+                print(f"Responses at {freq} Hz are stable, skipping its remaining repeats")
+                position = schedule.skip_repeats(step)
+            if position is None or position[0] != step:
+                print(f"Running result at {freq} Hz: {threshold} dB, {self.live.classification(ear, freq)} ({flag})")
+                sleep(schedule.frequency_pause)  # Pause after playing each frequency
 
         stream.stop_stream()
         stream.close()
 
+    def play_with_live_audiogram(self, p, schedule, ear, start):
+        """Plays an ear while its live audiogram fills in on the Tk main loop"""
+        from live_audiogram import LiveAudiogram
+
+        view = LiveAudiogram(ear, np.unique(schedule.base_frequencies).tolist(),
+                             responses=[d[:2] for d in self.ear_data(ear)])
+        self.post(view.show, self.root)
+        self.live_view = view
+        try:
+            self.player(p, schedule, ear=ear, start=start)
+        finally:
+            self.live_view = None
+            view.close()
+
+    def ear_data(self, ear):
+        """Returns the list collecting responses for the given ear"""
+        return self.left_data if ear == 'left' else self.right_data
+
     def on_click(self, x, y, button, pressed):
         """Callback function for mouse clicks"""
+        from pynput.mouse import Button
+
         if button == Button.left and pressed:
-            if self.signal:
-                d = self.signal + [datetime.now()]
-                print(f'Recording event: {d}')
-                self.right_data.append(d)
-                self.detected = True
+            self.record_response()
+
+    def record_response(self):
+        """Records a response to the tone currently playing"""
+        if self.signal:
+            d = self.signal + [datetime.now()]
+            print(f'Recording event: {d}')
+            flag = self.reaction_times.add(d[0], d[1], (d[3] - d[2]).total_seconds() * 1000)
+            if flag != 'ok':
+                print(f'Reaction time flagged as {flag}')
+            self.ear_data(self.ear).append(d)
+            self.detected = True
+            view = self.live_view  # may be closed by the main thread meanwhile
+            if view:
+                view.add_response(d[0], d[1])
 
     def listener(self):
         """Listens to mouse clicks"""
+        from pynput.mouse import Listener
+
         with Listener(on_click=self.on_click) as listener:
             listener.join()
 
-    def analyse_results(self, data, ear):
-        """Stores and visualizes results"""
-        now = datetime.now()
-
-        # Load data to DataFrame
-        df = pd.DataFrame(data, columns=['frequency', 'volume', 'played', 'heard'])
-        df['reaction_time'] = (df['heard'] - df['played']).dt.microseconds // 1000
-
-        # Create audiogram chart
-        audiogram_fig = plt.figure()
-        ax1 = audiogram_fig.add_subplot(111)
-        ax1.plot(df['frequency'], df['volume'], marker='x', linestyle='-', color='black')
-        ax1.set(title=f"Audiogram for {ear} ear", ylim=[90, -10], yticks=[90, 80, 70, 60, 50, 40, 30, 20, 10, 0, -10])
-        ax1.grid(True)
-        ax1.set_ylabel('Hearing Level in decibels (volume in dB)')
-        
-        # Add x-axis ticks and labels at the top of the chart
-        ax2 = ax1.twiny()
-        ax2.set_xlim(ax1.get_xlim())
-        ax2.set_xticks(df['frequency'])
-        ax2.set_xticklabels(df['frequency'])
-        ax2.set_xlabel('Pitch (frequency in Hz)')
-        ax2.xaxis.tick_top()
-
-        # Add colored rows for different hearing loss stages
-        ax1.axhspan(-10, 15, facecolor='green', alpha=0.3, label='Normal Hearing (0-15 dB)')
-        ax1.axhspan(16, 25, facecolor='yellow', alpha=0.3, label='Slight Hearing Loss (16-25 dB)')
-        ax1.axhspan(26, 40, facecolor='orange', alpha=0.3, label='Mild Hearing Loss (26-40 dB)')
-        ax1.axhspan(41, 55, facecolor='red', alpha=0.3, label='Moderate Hearing Loss (41-55 dB)')
-        ax1.axhspan(56, 70, facecolor='purple', alpha=0.3, label='Moderately Severe Hearing Loss (56-70 dB)')
-        ax1.axhspan(71, 90, facecolor='brown', alpha=0.3, label='Severe Hearing Loss (71-90 dB)')
-        ax1.axhspan(91, 120, facecolor='black', alpha=0.3, label='Profound Hearing Loss (91 dB or greater)')
-
-        ax1.legend()
-
-        # Save audiogram chart as image
-        audiogram_fig.savefig(f'./results_{ear}_{now:%Y%m%d%H%M%S}_audiogram.png')
+    def keyboard_listener(self):
+        """Listens to [ENTER] presses when running headless, until the test is finished
+
+        Reads the raw stdin descriptor through a selector with a timeout, so
+        the thread notices ``finished`` and never holds the stdin lock while
+        the interpreter shuts down (piped input used to abort the exit).
+        """
+        import selectors
+
+        try:
+            fd = sys.stdin.fileno()
+        except (AttributeError, ValueError, OSError):
+            return  # no stdin to listen to
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(fd, selectors.EVENT_READ)
+        except (ValueError, OSError):
+            # Regular files and /dev/null cannot be polled, but reading them never blocks
+            selector.close()
+            selector = None
+        try:
+            while not self.finished.is_set():
+                if selector is not None and not selector.select(timeout=0.1):
+                    continue
+                data = os.read(fd, 1024)
+                if not data:
+                    break  # end of input
+                for _ in range(data.count(b'\n')):
+                    self.record_response()
+        finally:
+            if selector is not None:
+                selector.close()
+
+    def analyse_results(self, data, ear, now):
+        """Stores and visualizes results, in files named after ``now``
+
+        The exports that need pandas (Excel sheet, thresholds extracted from
+        the trials) are written by ``write_exports``.
+        """
+        from audiogram import audiogram_figure, render_table
+
+        # Load data into a columnar session result (no pandas needed)
+        df = SessionResult.from_rows(data, ear)
+        ranges = df.hearing_loss_range(self.scheme)
+
+        # The audiogram image is saved once per session with both ears (see run_test)
+        if self.headless:
+            # No display: render the results table to an image instead of a window
+            render_table(df, f'./results_{ear}_{now:%Y%m%d%H%M%S}_table.png', scheme=self.scheme)
+        else:
+            self.post(self.display_results, audiogram_figure(df['frequency'], df['volume'], ear), df, ranges, ear)
 
-        # Display audiogram chart in a new window
-        audiogram_window = tk.Tk()
-        audiogram_window.title(f"Audiogram for {ear} ear")
-        canvas = FigureCanvasTkAgg(audiogram_fig, master=audiogram_window)
-        canvas.draw()
-        canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
-        
-        # Display Excel table in a new window
-        excel_window = tk.Tk()
-        excel_window.title(f"Portable Self Assessment Audiometer - {ear} ear")
-        excel_table = tk.Frame(excel_window)
-        excel_table.grid(row=0, column=0, padx=10, pady=10)
+        # Create CSV file
+        df.to_csv(f'./results_{ear}_{now:%Y%m%d%H%M%S}.csv')
+
+        # Running thresholds of every presentation, not just the clicks
+        print('Thresholds (ear, frequency, threshold dB, runs, responses, flag, hearing loss range):')
+        for row in self.live.thresholds():
+            if row[0] == ear:
+                print(*row)
+
+        # Test-retest reliability of repeated frequencies
+        rows, score = repeat_statistics(df['frequency'], df['volume'])
+        if not np.isnan(score):
+            print('Repeat statistics (frequency, n, mean dB, std dB, 95% CI low, 95% CI high):')
+            for row in rows:
+                print(*row)
+            print(f'Reliability score: {score:.0%} of repeats agree within 5 dB')
+
+        # Compare thresholds with otologically normal peers of the same age and sex
+        if self.age is not None:
+            points = self.live.audiogram(ear)
+            if points:
+                freqs, levels = zip(*points)
+                ranks = percentiles(self.age, self.sex, freqs, levels)
+                for freq, level, rank in zip(freqs, levels, ranks):
+                    if np.isnan(rank):
+                        print(f"{freq} Hz: no norm available")
+                    else:
+                        print(f"{freq} Hz at {level} dB: worse than {rank:.0f}% of {self.sex}s aged {self.age}")
+
+        # Reaction time summary collected during the test
+        self.reaction_summaries[ear] = self.reaction_times.summary()
+        print('Reaction time (group, key, count, mean ms, std ms, median ms):')
+        for row in self.reaction_summaries[ear]:
+            print(*row)
+
+        print("CSV file created successfully.")
 
-        table_label = tk.Label(excel_table, text="Portable Self Assessment Audiometer", font=("Arial", 16, "bold"))
-        table_label.grid(row=0, columnspan=5, sticky="w")
+        return df
 
-        headers = ['Sl. No.', 'Pitch (Frequency Hz)', 'Hearing Level (Volume dB)', 'Hearing Loss Range']
-        for i, header in enumerate(headers):
-            col_label = tk.Label(excel_table, text=header, font=("Arial", 12, "bold"))
-            col_label.grid(row=1, column=i, padx=5, pady=5)
+    def write_exports(self, ear, now, df, trials):
+        """Writes the Excel sheet and the thresholds extracted from the trials of a finished ear
 
-        for i, row in df.iterrows():
-            sl_no = tk.Label(excel_table, text=i+1, font=("Arial", 12))
-            sl_no.grid(row=i + 2, column=0, padx=5, pady=5, sticky="w")
+        These load pandas, so they run once the ear is recorded as finished;
+        the result CSV of the ear is named after the same ``now``.
+        """
+        from thresholds import extract_thresholds, trial_frame
 
-            freq_label = tk.Label(excel_table, text=row['frequency'], font=("Arial", 12))
-            freq_label.grid(row=i + 2, column=1, padx=5, pady=5)
+        df.to_excel(f'./results_{ear}_{now:%Y%m%d%H%M%S}.xlsx', self.scheme)
+        if trials:
+            extract_thresholds(trial_frame(trials)).to_csv(f'./results_{ear}_{now:%Y%m%d%H%M%S}_thresholds.csv', index=None)
+        print("Excel sheet and threshold file created successfully.")
 
-            vol_label = tk.Label(excel_table, text=row['volume'], font=("Arial", 12))
-            vol_label.grid(row=i + 2, column=2, padx=5, pady=5)
+    def display_results(self, audiogram_fig, df, ranges, ear):
+        """Shows the audiogram and the results table in windows of the main one"""
+        import tkinter as tk
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-            range_label = tk.Label(excel_table, text=self.get_hearing_loss_range(row['volume']), font=("Arial", 12))
-            range_label.grid(row=i + 2, column=3, padx=5, pady=5)
+        # Display audiogram chart in a new window
+        audiogram_window = tk.Toplevel(self.root)
+        audiogram_window.title(f"Audiogram for {ear} ear")
+        canvas = FigureCanvasTkAgg(audiogram_fig, master=audiogram_window)
+        canvas.draw()
+        canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
 
-        excel_window.mainloop()
+        # Display Excel table in a new window
+        from results_table import ResultsTable
+        excel_window = tk.Toplevel(self.root)
+        excel_window.title(f"Portable Self Assessment Audiometer - {ear} ear")
 
-        # Create CSV file
-        df.to_csv(f'./results_{ear}_{now:%Y%m%d%H%M%S}.csv', index=None)
+        table_label = tk.Label(excel_window, text="Portable Self Assessment Audiometer", font=("Arial", 16, "bold"))
+        table_label.pack(anchor="w", padx=10, pady=(10, 0))
 
-        # Create Excel sheet
-        df_excel = pd.DataFrame(data, columns=['Sl. No.', 'Pitch (Frequency Hz)', 'Hearing Level (Volume dB)', 'Hearing Loss Range'])
-        df_excel['Hearing Loss Range'] = df_excel['Hearing Level (Volume dB)'].apply(self.get_hearing_loss_range)
-        df_excel.to_excel(f'./results_{ear}_{now:%Y%m%d%H%M%S}.xlsx', index=None)
+        rows = zip(range(1, len(df) + 1), df['frequency'].tolist(), df['volume'].tolist(), ranges)
+        table = ResultsTable(excel_window, EXCEL_HEADERS, rows)
+        table.frame.pack(fill=tk.BOTH, expand=1, padx=10, pady=10)
 
-        print("Audiogram chart, CSV file, and Excel sheet created successfully.")
+    def display_history(self, patient_id, sessions):
+        """Shows every threshold of a patient's sessions in one sortable table"""
+        import tkinter as tk
+        from results_table import ResultsTable
 
-        return df
+        history_window = tk.Toplevel(self.root)
+        history_window.title(f"History of patient {patient_id}")
+        rows = zip(sessions.index.strftime('%Y-%m-%d %H:%M'), sessions['ear'].astype(str),
+                   sessions['frequency'].tolist(), sessions['threshold'].tolist())
+        table = ResultsTable(history_window, ['Date', 'Ear', 'Pitch (Frequency Hz)', 'Threshold (dB)'], rows)
+        table.frame.pack(fill=tk.BOTH, expand=1, padx=10, pady=10)
 
     def get_hearing_loss_range(self, volume):
         """Determines the hearing loss range based on volume level"""
-        if volume <= 15:
-            return 'Normal Hearing (0-15 dB)'
-        elif volume <= 25:
-            return 'Slight Hearing Loss (16-25 dB)'
-        elif volume <= 40:
-            return 'Mild Hearing Loss (26-40 dB)'
-        elif volume <= 55:
-            return 'Moderate Hearing Loss (41-55 dB)'
-        elif volume <= 70:
-            return 'Moderately Severe Hearing Loss (56-70 dB)'
-        elif volume <= 90:
-            return 'Severe Hearing Loss (71-90 dB)'
-        else:
-            return 'Profound Hearing Loss (91 dB or greater)'
+        return band_label(volume, self.scheme)
+
+    def replay_trials(self, trials):
+        """Feeds checkpointed [ear, run, frequency, volume, played, heard] trials to the live analysis"""
+        for ear, _, frequency, volume, _, heard in trials:
+            self.live.update(ear, frequency, volume, heard is not None)
+            if heard is not None:
+                self.stability.add(ear, frequency, volume)
+
+    @staticmethod
+    def replay_reaction_times(responses):
+        """Reaction time tracker holding checkpointed [frequency, volume, played, heard] responses"""
+        tracker = ReactionTimeTracker()
+        for frequency, volume, played, heard in responses:
+            tracker.add(frequency, volume, (heard - played).total_seconds() * 1000)
+        return tracker
 
     def run_test(self):
-        parser = argparse.ArgumentParser()
-        parser.add_argument('-r', '--repeat', help='Number of times each frequency is repeated', type=int, default=1)  # Change default value to 1
-        args = parser.parse_args()
+        args = self.args
+        self.scheme = args.scheme
+        self.age, self.sex = args.age, args.sex
+        self.live = LiveAnalysis(self.scheme)
+
+        # Resume an interrupted session from its checkpoint
+        state = None if args.restart else SessionCheckpoint.load(self.checkpoint.path)
+        if state:
+            print(f"Resuming interrupted session started at {state['started']:%Y-%m-%d %H:%M:%S}")
+            self.start_time = state['started']
+            args.repeat = state['repeat']
+            args.protocol = state['protocol'] or args.protocol
+        else:
+            self.checkpoint.close(finished=True)
+            self.start_time = datetime.now()
+
+        schedule = compile_protocol(args.protocol, repeat=args.repeat, early_stop=args.early_stop or None)
+        self.checkpoint.start(self.start_time, schedule.repeat, args.protocol)
 
-        self.start_time = datetime.now()
+        # Audio and plotting were loaded in the background while the instructions were shown
+        if self.warming:
+            self.warming.join()
+        import pyaudio
+        from audiogram import render_bilateral
 
-        p = pyaudio.PyAudio()
+        p = self.audio or pyaudio.PyAudio()
         # Start listener
-        p2 = threading.Thread(target=self.listener, daemon=True)
+        p2 = threading.Thread(target=self.keyboard_listener if self.headless else self.listener, daemon=True)
         p2.start()
 
-        # Run test for the right ear
-        print('Testing right ear...')
-        self.player(p, repeat=args.repeat, ear='right')
-
-        # Analyse and visualize results for the right ear
-        right_df = self.analyse_results(self.right_data, 'right')
-        self.right_data = []
+        results = {}
+        session_trials = []
+        try:
+            for ear in schedule.ears:
+                if state and ear in state['done']:
+                    # Finished before the interruption: restore its results instead of replaying it
+                    finished = state['finished'][ear]
+                    self.replay_trials(finished['trials'])
+                    session_trials.extend(finished['trials'])
+                    results[ear] = SessionResult.from_rows(finished['responses'], ear)
+                    self.reaction_summaries[ear] = self.replay_reaction_times(finished['responses']).summary()
+                    # Under the ear's own timestamp, in case they were cut short by the interruption
+                    self.write_exports(ear, finished['at'], results[ear], finished['trials'])
+                    continue
+                start = (0, 0)
+                resumed = state and state['ear'] == ear
+                # Clicks from before an interruption count in the reaction time summary too
+                self.reaction_times = self.replay_reaction_times(state['responses'] if resumed else [])
+                if resumed:
+                    self.ear_data(ear).extend(state['responses'])
+                    self.trials = state['trials']
+                    self.replay_trials(self.trials)
+                    start = schedule.next_position(*state['last']) or (len(schedule), 0)
+                    if (schedule.early_stop and start[0] < len(schedule) and start[1] == 0
+                            and self.stability.is_stable(ear, schedule.frequencies[start[0]])):
+                        start = schedule.skip_repeats(start[0]) or (len(schedule), 0)
+
+                # Run test for this ear
+                print(f'Testing {ear} ear...')
+                self.ear = ear
+                if self.headless or args.no_live:
+                    self.player(p, schedule, ear=ear, start=start)
+                else:
+                    self.play_with_live_audiogram(p, schedule, ear, start)
+                if self.stopped.is_set():
+                    # The main window was closed: abort like Ctrl+C
+                    raise KeyboardInterrupt
+
+                # Analyse and visualize results for this ear
+                now = datetime.now()
+                results[ear] = self.analyse_results(self.ear_data(ear), ear, now)
+                self.checkpoint.record_ear_done(ear, now)
+                self.write_exports(ear, now, results[ear], self.trials)
+                self.ear_data(ear).clear()
+                session_trials.extend(self.trials)
+                self.trials = []
+        except KeyboardInterrupt:
+            # Thresholds so far are already valid; keep the checkpoint to resume later
+            path = f'./results_partial_{datetime.now():%Y%m%d%H%M%S}_thresholds.csv'
+            self.live.to_csv(path)
+            if results:
+                render_bilateral(results, path.replace('_thresholds.csv', '_audiogram.png'))
+            self.checkpoint.close(finished=False)
+            print(f'Test aborted. Partial thresholds saved to {path}; run again to resume.')
+            self.post(self.set_status, 'Test aborted; run again to resume.')
+            return
+        finally:
+            # Stop reading stdin before the interpreter shuts down
+            self.finished.set()
+            if self.headless:
+                p2.join()
+
+        self.checkpoint.close(finished=True)
+
+        # One audiogram for the session: O right ear, X left ear
+        if results:
+            render_bilateral(results, f'./results_{self.start_time:%Y%m%d%H%M%S}_audiogram.png')
+
+        # Store the session (thresholds and every trial) in the session database
+        from history import threshold_shifts
+        from session_store import SessionStore
+        store = SessionStore(args.db)
+        try:
+            store.add_session(args.patient, self.start_time, self.live.thresholds(), session_trials,
+                              schedule.name, self.scheme, self.age, self.sex if self.age is not None else None)
+            if args.parquet:
+                from parquet_export import export_sessions
+                export_sessions(store, args.parquet)
+
+            # Compare this session with the patient's baseline session
+            if args.patient:
+                history = store.load(args.patient)
+                shifts = threshold_shifts(history)
+                current = shifts[shifts['date'] == self.start_time]
+                if current.empty:
+                    print('No thresholds at 2, 3 or 4 kHz in this session: shift from baseline not computed.')
+                else:
+                    current = current.iloc[0]
+                    print(f"Shift from baseline: right {current['shift_right']:.1f} dB, left {current['shift_left']:.1f} dB")
+                    if current['sts']:
+                        print('Standard threshold shift detected - refer for a full audiological evaluation.')
+                if not self.headless and len(history):
+                    self.post(self.display_history, args.patient, history.loc[args.patient])
+        finally:
+            store.close()
+
+        # Summary metrics (PTA, high-frequency average, asymmetry, 4 kHz notch) of the clinical thresholds
+        metrics = compute_metrics(from_thresholds(self.live.thresholds())) if results else None
+        for name, values in (metrics or {}).items():
+            print(f'{name}: {np.round(values[0], 1)}')
+
+        # Everything of the session in one PDF
+        from report import write_report
+        path = f'./results_{self.start_time:%Y%m%d%H%M%S}_report.pdf'
+        metadata = [('Date', f'{self.start_time:%Y-%m-%d}'), ('Start time', f'{self.start_time:%H:%M:%S}'),
+                    ('Duration', str(datetime.now() - self.start_time).split('.')[0]), ('Protocol', schedule.name),
+                    ('Patient', args.patient or '-'), ('Age / sex', f'{self.age} / {self.sex}' if self.age is not None else '-'),
+                    ('Classification scheme', self.scheme)]
+        write_report(path, results, self.live.thresholds(), metadata, metrics, self.reaction_summaries)
+        print(f'Report saved to {path}')
 
         print('Test is finished. Please check visualizations and files.')
+        self.post(self.set_status, 'Test is finished. Please check visualizations and files.')
 
         # Display date, time, and duration
-        self.display_date_time_duration()
+        duration = datetime.now() - self.start_time
+        if self.headless:
+            print(f"Date: {self.start_time:%Y-%m-%d}  Start Time: {self.start_time:%H:%M:%S}  Duration: {duration}")
+        else:
+            self.post(self.display_date_time_duration, duration)
 
-    def display_date_time_duration(self):
-        now = datetime.now()
-        duration = now - self.start_time
+    def display_date_time_duration(self, duration):
+        import tkinter as tk
 
-        # Display test information in a new window
-        info_window = tk.Tk()
+        # Display test information in a window of the main one
+        info_window = tk.Toplevel(self.root)
         info_window.title("Test Information")
 
         date_label = tk.Label(info_window, text=f"Date: {self.start_time.strftime('%Y-%m-%d')}", font=("Arial", 12))
@@ -231,8 +574,10 @@ class HearingTest:
         duration_label = tk.Label(info_window, text=f"Duration: {duration}", font=("Arial", 12))
         duration_label.pack()
 
-        info_window.mainloop()
-
 if __name__ == '__main__':
     test = HearingTest()
-    test.start_test()
+    if test.headless:
+        print('Running headless: press [ENTER] when you hear the pulsing sound.')
+        test.run_test()
+    else:
+        test.start_test()
@@ -0,0 +1,373 @@
+"""Audiogram and results table rendering on the Agg backend
+
+Nothing here imports pyplot or tkinter, so reports can be rendered on
+machines without a display. Usage:
+
+    python audiogram.py results_right_<timestamp>.csv [...] [-o folder] [-f png|svg|pdf] [-j workers]
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import matplotlib.style
+import numpy as np
+from matplotlib import font_manager
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgb
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+
+from classification import SCHEMES, classify_codes
+from protocol import EARS, compile_protocol
+from session_result import EXCEL_HEADERS, SessionResult
+
+# Hearing loss stages shaded behind the audiogram: (low, high, colour)
+BANDS = [(-10, 15, 'green'), (16, 25, 'yellow'), (26, 40, 'orange'), (41, 55, 'red'),
+         (56, 70, 'purple'), (71, 90, 'brown'), (91, 120, 'black')]
+
+# Table cell fill of each band: its audiogram colour at 30 % on white; the extra
+# last row is white, so band code -1 (no value) indexes it directly
+BAND_FILLS = np.array([255 * (0.7 + 0.3 * np.array(to_rgb(color))) for _, _, color in BANDS] + [(255, 255, 255)]).round().astype(np.uint8)
+HEADER_FILL = (230, 230, 230)
+BAND_COLUMNS = (2, 3)  # hearing level and hearing loss range cells are coloured by band
+
+# Pillow's names of the raster formats
+PIL_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'tif': 'TIFF', 'tiff': 'TIFF', 'webp': 'WEBP'}
+
+# Response line of a single-ear audiogram
+RESPONSE_STYLE = dict(marker='x', linestyle='-', color='black')
+
+# Standard audiogram symbols: O right / X left, triangle / square when masked
+EAR_SYMBOLS = {
+    ('right', False): dict(marker='o', markersize=8, fillstyle='none', linestyle='-', color='red', label='Right ear (O)'),
+    ('left', False): dict(marker='x', markersize=8, linestyle='--', color='blue', label='Left ear (X)'),
+    ('right', True): dict(marker='^', markersize=8, fillstyle='none', linestyle='-', color='red', label='Right ear, masked (\u25b3)'),
+    ('left', True): dict(marker='s', markersize=8, fillstyle='none', linestyle='--', color='blue', label='Left ear, masked (\u25a1)'),
+}
+
+RASTER_FORMATS = tuple(PIL_FORMATS)
+
+
+def draw_background(fig, title, frequencies, styles=(RESPONSE_STYLE,), animated=False):
+    """Draws the audiogram with one empty response line per style
+
+    Returns the data axes and the lines; animated lines are left out of full
+    draws so they can be blitted.
+    """
+    # Room above for both axis titles and below for the legend
+    fig.subplots_adjust(top=0.84, bottom=0.34)
+    ax1 = fig.add_subplot(111)
+    # Above the axes frame, as the blitted lines are drawn after it
+    lines = [ax1.plot([], [], animated=animated, zorder=3, **style)[0] for style in styles]
+    # Scale the frequency axis as if the responses were already plotted
+    ax1.update_datalim(np.column_stack([frequencies, np.zeros(len(frequencies))]))
+    ax1.set(title=title, ylim=[90, -10], yticks=[90, 80, 70, 60, 50, 40, 30, 20, 10, 0, -10])
+    ax1.grid(True)
+    ax1.set_ylabel('Hearing Level in decibels (volume in dB)')
+
+    # Add x-axis ticks and labels at the top of the chart
+    ax2 = ax1.twiny()
+    ax2.set_xlim(ax1.get_xlim())
+    ax2.set_xticks(frequencies)
+    ax2.set_xticklabels(frequencies)
+    ax2.set_xlabel('Pitch (frequency in Hz)')
+    ax2.xaxis.tick_top()
+    # Its frame would be drawn over the responses; ax1's is in the same place
+    ax2.spines[:].set_visible(False)
+
+    # Add colored rows for different hearing loss stages
+    for (low, high, color), label in zip(BANDS, SCHEMES['default']['labels']):
+        ax1.axhspan(low, high, facecolor=color, alpha=0.3, label=label)
+    # Pinned under the plot: a 'best' location would depend on the responses,
+    # which a cached background never sees, and could cover them
+    ax1.legend(loc='upper center', bbox_to_anchor=(0.5, -0.1), ncols=2, fontsize='small')
+    return ax1, lines
+
+
+def ear_styles(ears, masked=()):
+    """Symbols of the given ears, ``masked`` listing the ears tested with masking"""
+    return tuple(EAR_SYMBOLS[ear, ear in masked] for ear in ears)
+
+
+def audiogram_figure(frequency, volume, ear, figsize=(6.4, 4.8), dpi=100, theme='default'):
+    """Builds the audiogram of one ear as a Figure attached to an Agg canvas"""
+    with matplotlib.style.context(theme):
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        _, (line,) = draw_background(fig, f"Audiogram for {ear} ear", np.unique(frequency).tolist())
+        line.set_data(frequency, volume)
+    return fig
+
+
+def bilateral_figure(results, masked=(), figsize=(6.4, 4.8), dpi=100, theme='default'):
+    """Builds one audiogram with every ear of ``results`` (ear -> SessionResult)"""
+    ears = tuple(results)
+    with matplotlib.style.context(theme):
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        _, lines = draw_background(fig, 'Audiogram', session_frequencies(results), ear_styles(ears, masked))
+        for line, ear in zip(lines, ears):
+            line.set_data(results[ear]['frequency'], results[ear]['volume'])
+    return fig
+
+
+def session_frequencies(results):
+    """Sorted frequencies tested in any ear of a session"""
+    return np.unique(np.concatenate([result['frequency'] for result in results.values()])).tolist()
+
+
+class AudiogramTemplate:
+    """An audiogram background rendered once, with the responses blitted on top
+
+    The bands, axes, ticks and legend only depend on the title, the tested
+    frequencies, the symbols, the size and the theme, so they are drawn a
+    single time and kept as a pixel buffer. Drawing a session restores that
+    buffer and draws the response lines alone. Not thread safe: one template
+    per thread.
+    """
+
+    def __init__(self, title, frequencies, styles=(RESPONSE_STYLE,), figsize=(6.4, 4.8), dpi=100, theme='default'):
+        with matplotlib.style.context(theme):
+            self.figure = Figure(figsize=figsize, dpi=dpi)
+            self.canvas = FigureCanvasAgg(self.figure)
+            self.axes, self.lines = draw_background(self.figure, title, list(frequencies), styles, animated=True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def draw(self, *series):
+        """Restores the background and blits one (frequency, volume) series per line"""
+        self.canvas.restore_region(self.background)
+        for line, (frequency, volume) in zip(self.lines, series):
+            line.set_data(frequency, volume)
+            self.axes.draw_artist(line)
+        self.canvas.blit(self.figure.bbox)
+
+    def pixels(self, *series):
+        """RGBA image of the audiogram with the given responses"""
+        self.draw(*series)
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def save(self, out, *series, fmt=None):
+        """Writes the audiogram with the given responses as a raster image"""
+        imsave(out, self.pixels(*series), format=fmt, dpi=self.figure.dpi)
+
+
+@lru_cache(maxsize=16)
+def audiogram_template(ear, frequencies, figsize=(6.4, 4.8), dpi=100, theme='default'):
+    """Shared template per ear, frequency set (a tuple), size, DPI and matplotlib style"""
+    return AudiogramTemplate(f"Audiogram for {ear} ear", frequencies, figsize=figsize, dpi=dpi, theme=theme)
+
+
+def bilateral_template(ears, frequencies, masked=(), figsize=(6.4, 4.8), dpi=100, theme='default'):
+    """Shared two-ear template per ears, frequency set, masked ears, size, DPI and style"""
+    # One cache key however the arguments are passed, so warm-up and callers share templates
+    return _bilateral_template(tuple(ears), tuple(frequencies), tuple(masked), tuple(figsize), dpi, theme)
+
+
+@lru_cache(maxsize=16)
+def _bilateral_template(ears, frequencies, masked, figsize, dpi, theme):
+    return AudiogramTemplate('Audiogram', frequencies, ear_styles(ears, masked), figsize, dpi, theme)
+
+
+def table_rows(result, scheme='default'):
+    """Cell texts of the results table and the band code of every row"""
+    codes = classify_codes(result['volume'], scheme)
+    labels = SCHEMES[scheme]['labels']
+    rows = [[str(i + 1), str(f), str(v), labels[c] if c >= 0 else ''] for i, (f, v, c) in
+            enumerate(zip(result['frequency'].tolist(), result['volume'].tolist(), codes.tolist()))]
+    return rows, codes
+
+
+def table_figure(result, scheme='default', dpi=100):
+    """Builds the results table (as shown in the Tk table window) as a Figure, for vector output"""
+    rows, codes = table_rows(result, scheme)
+    fig = Figure(figsize=(9, 0.6 + 0.3 * (len(rows) + 1)), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.axis('off')
+    ax.set_title(f"Portable Self Assessment Audiometer - {result.ear} ear", fontweight='bold')
+    if rows:
+        fills = BAND_FILLS / 255
+        colours = [[fills[-1] if i not in BAND_COLUMNS else fills[code] for i in range(len(EXCEL_HEADERS))] for code in codes]
+        table = ax.table(cellText=rows, colLabels=EXCEL_HEADERS, cellColours=colours, loc='center', cellLoc='center')
+        table.auto_set_column_width(range(len(EXCEL_HEADERS)))
+    return fig
+
+
+@lru_cache(maxsize=8)
+def _fonts(size):
+    """Regular and bold DejaVu Sans (matplotlib's own font) at ``size`` pixels"""
+    from PIL import ImageFont
+
+    bold = font_manager.FontProperties(family='DejaVu Sans', weight='bold')
+    return (ImageFont.truetype(font_manager.findfont('DejaVu Sans'), size),
+            ImageFont.truetype(font_manager.findfont(bold), size))
+
+
+def table_image(result, scheme='default', dpi=100):
+    """Draws the results table straight into a PIL image
+
+    Cell backgrounds are filled as numpy slices from the precomputed band
+    colours; only the texts and grid lines go through ImageDraw. No figure,
+    no layout pass and no Excel round-trip.
+    """
+    from PIL import Image, ImageDraw
+
+    size = round(10 * dpi / 72)  # 10 pt
+    regular, bold = _fonts(size)
+    rows, codes = table_rows(result, scheme)
+    pad, row_height, margin = size // 2 + 2, round(size * 1.8), size
+    widths = [max([bold.getlength(header)] + [regular.getlength(row[i]) for row in rows]) + 2 * pad
+              for i, header in enumerate(EXCEL_HEADERS)]
+    x = (margin + np.r_[0, np.cumsum(widths)]).round().astype(int)
+    y = margin * 3 + row_height * np.arange(len(rows) + 2)
+
+    pixels = np.full((y[-1] + margin, x[-1] + margin, 3), 255, dtype=np.uint8)
+    pixels[y[0]:y[1], x[0]:x[-1]] = HEADER_FILL
+    band_rows = np.repeat(BAND_FILLS[codes], row_height, axis=0)[:, None, :]
+    for column in BAND_COLUMNS:
+        pixels[y[1]:y[-1], x[column]:x[column + 1]] = band_rows
+
+    image = Image.fromarray(pixels)
+    draw = ImageDraw.Draw(image)
+    draw.text((pixels.shape[1] / 2, margin * 1.5), f"Portable Self Assessment Audiometer - {result.ear} ear",
+              font=bold, fill='black', anchor='mm')
+    for top in y:
+        draw.line([(x[0], top), (x[-1], top)], fill='black')
+    for left in x:
+        draw.line([(left, y[0]), (left, y[-1])], fill='black')
+    centres = (x[:-1] + x[1:]) / 2
+    for centre, header in zip(centres, EXCEL_HEADERS):
+        draw.text((centre, y[0] + row_height / 2), header, font=bold, fill='black', anchor='mm')
+    # Cell texts repeat a lot (frequencies, range labels): render each one once
+    masks = {}
+    for top, row in zip(y[1:], rows):
+        for centre, text in zip(centres, row):
+            if text not in masks:
+                left, upper, right, lower = regular.getbbox(text, anchor='mm')
+                mask = Image.new('L', (max(right - left, 1), max(lower - upper, 1)))
+                ImageDraw.Draw(mask).text((-left, -upper), text, font=regular, fill=255, anchor='mm')
+                masks[text] = mask, left, upper
+            mask, left, upper = masks[text]
+            image.paste((0, 0, 0), (round(centre + left), round(top + row_height / 2 + upper)), mask)
+    return image
+
+
+def _format(out, fmt):
+    if fmt is None:
+        fmt = os.path.splitext(out)[1][1:].lower() if isinstance(out, str) else 'png'
+    return fmt
+
+
+def render_audiogram(result, out, fmt=None, dpi=100, theme='default'):
+    """Writes the audiogram of a SessionResult to a path or file-like buffer
+
+    Raster formats are blitted onto a cached background template; vector
+    formats need the full figure.
+    """
+    fmt = _format(out, fmt)
+    frequency, volume = result['frequency'], result['volume']
+    if fmt in RASTER_FORMATS:
+        template = audiogram_template(result.ear, tuple(np.unique(frequency).tolist()), dpi=dpi, theme=theme)
+        template.save(out, (frequency, volume), fmt=fmt)
+    else:
+        audiogram_figure(frequency, volume, result.ear, dpi=dpi, theme=theme).savefig(out, format=fmt)
+
+
+def render_bilateral(results, out, fmt=None, masked=(), dpi=100, theme='default'):
+    """Writes both ears of a session (ear -> SessionResult) as one audiogram"""
+    fmt = _format(out, fmt)
+    ears = tuple(ear for ear in ('right', 'left') if ear in results)
+    results = {ear: results[ear] for ear in ears}
+    if fmt in RASTER_FORMATS:
+        template = bilateral_template(ears, tuple(session_frequencies(results)), tuple(masked), dpi=dpi, theme=theme)
+        template.save(out, *((results[ear]['frequency'], results[ear]['volume']) for ear in ears), fmt=fmt)
+    else:
+        bilateral_figure(results, masked, dpi=dpi, theme=theme).savefig(out, format=fmt)
+
+
+def render_table(result, out, fmt=None, scheme='default', dpi=100):
+    """Writes the results table of a SessionResult to a path or file-like buffer
+
+    Raster formats are drawn directly; vector formats go through a figure.
+    """
+    fmt = _format(out, fmt)
+    if fmt in RASTER_FORMATS:
+        table_image(result, scheme, dpi).save(out, format=PIL_FORMATS[fmt], dpi=(dpi, dpi))
+    else:
+        table_figure(result, scheme, dpi=dpi).savefig(out, format=fmt, bbox_inches='tight')
+
+
+def render_files(paths, output='.', fmt='png', scheme='default'):
+    """Worker: renders the audiogram and table of a chunk of result files"""
+    rendered = []
+    for path in paths:
+        try:
+            result = SessionResult.read_csv(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f'\nSkipping {path}: {e}', file=sys.stderr)
+            continue
+        stem = os.path.join(output, os.path.splitext(os.path.basename(path))[0])
+        render_audiogram(result, f'{stem}_audiogram.{fmt}', fmt)
+        render_table(result, f'{stem}_table.{fmt}', fmt, scheme)
+        rendered.append(stem)
+    return rendered
+
+
+def warm_up(protocol=None, dpis=(100,)):
+    """Loads fonts and renders the templates once per process
+
+    Without ``protocol`` (the worker initializer of ``render_files``) these
+    are the standard protocol's single-ear templates. With a protocol file
+    they are the two-ear templates its sessions are saved with, at ``dpis``.
+    """
+    schedule = compile_protocol(protocol) if protocol else compile_protocol()
+    frequencies = tuple(np.unique(schedule.base_frequencies).tolist())
+    if protocol is None:
+        for ear in EARS:
+            audiogram_template(ear, frequencies)
+        return
+    ears = tuple(ear for ear in ('right', 'left') if ear in schedule.ears)
+    for dpi in dpis:
+        bilateral_template(ears, frequencies, dpi=dpi)
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render audiograms and result tables without a display')
+    parser.add_argument('files', nargs='+', help='results_<ear>_<timestamp>.csv files')
+    parser.add_argument('-o', '--output', default='.', help='Folder for the rendered images')
+    parser.add_argument('-f', '--format', default='png', choices=['png', 'svg', 'pdf'])
+    parser.add_argument('-s', '--scheme', choices=sorted(SCHEMES), default='default')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('-c', '--chunk-size', type=int, default=16, help='Files handed to a worker at a time')
+    parser.add_argument('--max-tasks', type=int, default=32,
+                        help='Chunks a worker renders before it is replaced, to bound its memory')
+    args = parser.parse_args()
+
+    chunks = chunked(args.files, args.chunk_size)
+    done = 0
+    if args.workers <= 1:
+        # Not worth starting processes: render in this one, templates stay warm all along
+        results = (render_files(chunk, args.output, args.format, args.scheme) for chunk in chunks)
+    else:
+        # Workers keep their fonts and templates between chunks and are recycled after max_tasks
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=warm_up, max_tasks_per_child=args.max_tasks)
+        futures = [pool.submit(render_files, chunk, args.output, args.format, args.scheme) for chunk in chunks]
+        results = (future.result() for future in as_completed(futures))
+    for rendered in results:
+        done += len(rendered)
+        print(f'\r[{done}/{len(args.files)}] sessions rendered', end='', file=sys.stderr)
+    print(file=sys.stderr)
+    if args.workers > 1:
+        pool.shutdown()
+    print(f'Rendered {done} audiograms and tables to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
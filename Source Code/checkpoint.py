@@ -0,0 +1,99 @@
+import os
+
+from trial_log import MAGIC, TrialLog, read_log, valid_length
+
+
+class SessionCheckpoint:
+    """Append-only record of a running test so it can be resumed after a crash
+
+    Every trial is appended to a binary ``TrialLog``, which fsyncs in
+    batches of ``sync_every`` trials or ``sync_interval`` seconds, so a power
+    cut on the Pi loses at most one batch and the test resumes before it.
+    The session header and finished ears are synced straight away. The file
+    is removed once the session finishes normally.
+    """
+
+    def __init__(self, path='./session_checkpoint.trl', sync_every=8, sync_interval=10.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._log = None
+
+    def _open(self):
+        if self._log is None:
+            self._log = TrialLog(self.path, self.sync_every, self.sync_interval)
+        return self._log
+
+    def start(self, start_time, repeat, protocol):
+        """Writes the session header (only once per checkpoint file)"""
+        if valid_length(self.path) <= len(MAGIC):
+            self._open().start(start_time, repeat, protocol)
+
+    def record_trial(self, ear, step, level, frequency, volume, played, heard):
+        """Stores one presentation: its position in the procedure and the response"""
+        self._open().trial(ear, int(step), int(level), int(frequency), int(volume), played, heard)
+
+    def record_ear_done(self, ear, finished):
+        """Marks an ear as finished so it is not replayed on resume
+
+        ``finished`` is the time its result files are named after.
+        """
+        self._open().ear_done(ear, finished)
+
+    def close(self, finished=True):
+        """Closes the log (syncing what is pending) and deletes it when the session completed"""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if finished and os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def load(path='./session_checkpoint.trl'):
+        """Reads a checkpoint and returns the state needed to resume, or None
+
+        ``last`` holds the (step, level, heard) of the final trial of the
+        unfinished ear; the protocol schedule turns it into the next position.
+        ``finished`` keeps the responses, trials and finishing time of every
+        ear in ``done``.
+        """
+        state = None
+        for record in read_log(path):
+            event = record[0]
+            if event == 'start':
+                _, started, repeat, protocol = record
+                state = {
+                    'started': started,
+                    'repeat': repeat,
+                    'protocol': protocol,
+                    'ear': None,
+                    'last': None,
+                    'responses': [],
+                    'trials': [],
+                    'done': [],
+                    'finished': {},
+                }
+            elif state is None:
+                continue
+            elif event == 'trial':
+                _, ear, step, level, frequency, volume, played, heard = record
+                if ear != state['ear']:
+                    state['ear'] = ear
+                    state['responses'] = []
+                    state['trials'] = []
+                if heard:
+                    state['responses'].append([frequency, volume, played, heard])
+                state['trials'].append([ear, step, frequency, volume, played, heard])
+                state['last'] = (step, level, heard is not None)
+            elif event == 'ear_done':
+                _, ear, finished = record
+                state['done'].append(ear)
+                own = state['ear'] == ear
+                state['finished'][ear] = {'responses': state['responses'] if own else [],
+                                          'trials': state['trials'] if own else [],
+                                          'at': finished}
+                state['ear'] = None
+                state['last'] = None
+                state['responses'] = []
+                state['trials'] = []
+        return state
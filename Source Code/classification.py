@@ -0,0 +1,60 @@
+import numpy as np
+
+# Classification schemes as data tables: upper band edges in dB HL and one
+# label per band (one more label than edges). 'inclusive' means a threshold
+# equal to an edge still belongs to the lower band (``volume <= edge``).
+SCHEMES = {
+    # Bands used by the audiogram and results table since the first version
+    'default': {
+        'edges': [15, 25, 40, 55, 70, 90],
+        'labels': [
+            'Normal Hearing (0-15 dB)',
+            'Slight Hearing Loss (16-25 dB)',
+            'Mild Hearing Loss (26-40 dB)',
+            'Moderate Hearing Loss (41-55 dB)',
+            'Moderately Severe Hearing Loss (56-70 dB)',
+            'Severe Hearing Loss (71-90 dB)',
+            'Profound Hearing Loss (91 dB or greater)',
+        ],
+        'inclusive': True,
+    },
+    # ASHA degrees of hearing loss (Clark, 1981)
+    'asha': {
+        'edges': [15, 25, 40, 55, 70, 90],
+        'labels': ['Normal', 'Slight', 'Mild', 'Moderate', 'Moderately severe', 'Severe', 'Profound'],
+        'inclusive': True,
+    },
+    # WHO World Report on Hearing (2021) grades
+    'who2021': {
+        'edges': [20, 35, 50, 65, 80, 95],
+        'labels': ['Normal', 'Mild', 'Moderate', 'Moderately severe', 'Severe', 'Profound', 'Complete'],
+        'inclusive': False,
+    },
+}
+
+
+def classify_codes(values, scheme='default'):
+    """Returns the band index of every threshold (-1 for missing values)
+
+    Works on any array-like of thresholds in one ``np.searchsorted`` call.
+    """
+    table = SCHEMES[scheme]
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.searchsorted(table['edges'], values, side='left' if table['inclusive'] else 'right')
+    codes = codes.astype(np.int8)
+    codes[np.isnan(values)] = -1
+    return codes
+
+
+def classify(values, scheme='default'):
+    """Classifies thresholds into an ordered pandas Categorical of band labels"""
+    import pandas as pd
+
+    return pd.Categorical.from_codes(classify_codes(values, scheme),
+                                     categories=SCHEMES[scheme]['labels'], ordered=True)
+
+
+def band_label(volume, scheme='default'):
+    """Label of the band a single threshold falls in"""
+    code = classify_codes([volume], scheme)[0]
+    return SCHEMES[scheme]['labels'][code] if code >= 0 else None
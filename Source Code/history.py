@@ -0,0 +1,52 @@
+
+import numpy as np
+import pandas as pd
+
+from metrics import EARS, masked_mean, threshold_array
+
+STS_FREQUENCIES = (2000, 3000, 4000)  # OSHA standard threshold shift frequencies
+STS_DB = 10                           # average shift that counts as a standard threshold shift
+
+
+def threshold_shifts(history, frequencies=STS_FREQUENCIES, shift_db=STS_DB):
+    """Shift of every session against each patient's first (baseline) session
+
+    ``history`` is a frame as returned by ``SessionStore.load`` (or with
+    patient_id/date columns). The average over ``frequencies`` needs at least
+    two of them to be tested; every patient and session is handled in one
+    vectorized pass. Returns one row per session with the shift of each ear
+    and whether it is a standard threshold shift; sessions without any of
+    the ``frequencies`` are left out.
+    """
+    df = history.reset_index() if 'patient_id' not in history else history
+    df = df[df['frequency'].isin(frequencies)]
+    if df.empty:
+        # No session tested (or heard) any of the frequencies: nothing to compare
+        return pd.DataFrame({'patient_id': pd.Series(dtype=object), 'date': pd.Series(dtype='datetime64[ns]'),
+                             **{f'shift_{ear}': pd.Series(dtype=float) for ear in EARS}, 'sts': pd.Series(dtype=bool)})
+    # Session numbers in (patient, date) order
+    codes = df.groupby(['patient_id', 'date'], sort=True).ngroup().to_numpy()
+    _, rows = np.unique(codes, return_index=True)
+    keys = df.iloc[rows]
+
+    array, _ = threshold_array(df.assign(session=codes), frequencies=sorted(frequencies), value='threshold')
+    average = masked_mean(array, list(range(len(frequencies))), min_count=2)
+
+    # Sessions are sorted by patient then date, so a patient's first session is the baseline
+    patients = keys['patient_id'].to_numpy()
+    starts = np.r_[True, patients[1:] != patients[:-1]]
+    baseline = np.flatnonzero(starts)[np.cumsum(starts) - 1]
+    shift = average - average[baseline]
+
+    result = pd.DataFrame({'patient_id': patients, 'date': keys['date'].to_numpy()})
+    for i, ear in enumerate(EARS):
+        result[f'shift_{ear}'] = shift[:, i]
+    result['sts'] = (shift >= shift_db).any(axis=1)
+    return result
+
+
+def flagged_workers(history, frequencies=STS_FREQUENCIES, shift_db=STS_DB):
+    """Patients whose most recent session shows a standard threshold shift"""
+    shifts = threshold_shifts(history, frequencies, shift_db)
+    latest = ~shifts['patient_id'].duplicated(keep='last')
+    return shifts[latest & shifts['sts']].reset_index(drop=True)
@@ -0,0 +1,79 @@
+import csv
+
+from classification import band_label
+
+
+class _FrequencyState:
+    """Per-level counts and the current threshold of one ear/frequency"""
+
+    __slots__ = ('heard', 'shown', 'threshold', 'n_runs', 'n_responses', 'flag')
+
+    def __init__(self):
+        self.heard = {}
+        self.shown = {}
+        self.threshold = None
+        self.n_runs = 0
+        self.n_responses = 0
+        self.flag = 'no_response'
+
+
+class LiveAnalysis:
+    """Thresholds, classification and audiogram points updated after every trial
+
+    Applies the same rule as ``thresholds.extract_thresholds`` (lowest level
+    heard on at least ``min_responses`` runs and on half the runs that
+    presented it), but incrementally. An update only revisits the levels of
+    one frequency, which the protocol bounds, so the cost per trial does not
+    grow with the session. Results are valid at any point, including after
+    an aborted test.
+    """
+
+    def __init__(self, scheme='default', min_responses=2):
+        self.scheme = scheme
+        self.min_responses = min_responses
+        self.states = {}
+
+    def update(self, ear, frequency, volume, heard):
+        """Adds one presentation and returns the (threshold, flag) of its frequency"""
+        state = self.states.setdefault((ear, int(frequency)), _FrequencyState())
+        state.shown[volume] = state.shown.get(volume, 0) + 1
+        if heard:
+            state.heard[volume] = state.heard.get(volume, 0) + 1
+            state.n_responses += 1
+        state.n_runs = max(state.n_runs, state.shown[volume])
+
+        qualified = [level for level, n in state.heard.items()
+                     if n >= self.min_responses and 2 * n >= state.shown[level]]
+        if state.n_responses == 0:
+            state.threshold, state.flag = None, 'no_response'
+        elif qualified:
+            state.threshold, state.flag = min(qualified), 'ok'
+        else:
+            state.threshold = min(state.heard)
+            state.flag = 'single_run' if state.n_runs < self.min_responses else 'inconsistent'
+        return state.threshold, state.flag
+
+    def classification(self, ear, frequency):
+        """Band label of the current threshold at one frequency"""
+        state = self.states.get((ear, int(frequency)))
+        if state is None or state.threshold is None:
+            return None
+        return band_label(state.threshold, self.scheme)
+
+    def audiogram(self, ear):
+        """Sorted (frequency, threshold) points of the provisional audiogram"""
+        return sorted((freq, state.threshold) for (e, freq), state in self.states.items()
+                      if e == ear and state.threshold is not None)
+
+    def thresholds(self):
+        """Rows of (ear, frequency, threshold, n_runs, n_responses, flag, hearing loss range)"""
+        return [(ear, freq, s.threshold, s.n_runs, s.n_responses, s.flag,
+                 band_label(s.threshold, self.scheme) if s.threshold is not None else None)
+                for (ear, freq), s in sorted(self.states.items())]
+
+    def to_csv(self, path):
+        """Saves the current thresholds, e.g. when a test is aborted"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ear', 'frequency', 'threshold', 'n_runs', 'n_responses', 'flag', 'hearing_loss_range'])
+            writer.writerows(self.thresholds())
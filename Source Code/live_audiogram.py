@@ -0,0 +1,105 @@
+import queue
+from time import perf_counter
+
+from matplotlib.figure import Figure
+
+from audiogram import RESPONSE_STYLE, draw_background
+
+# Marker of the tone being played
+TONE_STYLE = dict(marker='o', markersize=10, fillstyle='none', linestyle='none', color='blue')
+
+
+class LiveAudiogram:
+    """Audiogram window that fills in while the test is running
+
+    The test and the click listener run in other threads and only put
+    events on a queue, so the view can be created and fed from any thread.
+    ``show`` opens the window on the Tk main loop, which polls that queue
+    with ``after`` and redraws by blitting the animated artists onto a
+    cached background, never with a full ``canvas.draw()``. Drawing takes at
+    most ``max_load`` of the UI thread's time, so the audio thread is never
+    starved.
+    """
+
+    def __init__(self, ear, frequencies, responses=(), interval_ms=50, max_load=0.25):
+        self.ear = ear
+        self.interval_ms = interval_ms
+        self.max_load = max_load
+        self.events = queue.SimpleQueue()
+        self.frequency = [f for f, v in responses]
+        self.volume = [v for f, v in responses]
+        self.window = None
+
+        self.figure = Figure(figsize=(6.4, 4.8), dpi=100)
+        self.axes, (self.line, self.tone) = draw_background(self.figure, f"Audiogram for {ear} ear", list(frequencies),
+                                                            (RESPONSE_STYLE, TONE_STYLE), animated=True)
+        self.line.set_data(self.frequency, self.volume)
+
+    def show(self, master):
+        """Opens the window on top of ``master`` and starts polling (Tk main thread)"""
+        import tkinter as tk
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.window = tk.Toplevel(master)
+        self.window.title(f"Live audiogram for {self.ear} ear")
+        # The test closes it; closing it by hand only hides it
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+        # Every full draw (first show, resize) refreshes the cached background
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.draw()
+        self.window.after(self.interval_ms, self.poll)
+
+    def show_tone(self, frequency, volume):
+        """Marks the tone being played (any thread)"""
+        self.events.put(('tone', frequency, volume))
+
+    def add_response(self, frequency, volume):
+        """Adds a response to the audiogram (any thread)"""
+        self.events.put(('response', frequency, volume))
+
+    def close(self):
+        """Closes the window once the queued events are drawn (any thread)"""
+        self.events.put(('close', None, None))
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.blit()
+
+    def blit(self):
+        """Redraws only the animated artists on top of the cached background"""
+        if self.background is None:
+            return
+        self.canvas.restore_region(self.background)
+        self.axes.draw_artist(self.line)
+        self.axes.draw_artist(self.tone)
+        self.canvas.blit(self.axes.bbox)
+
+    def poll(self):
+        """Applies the queued events in one frame and schedules the next poll"""
+        start = perf_counter()
+        changed = False
+        while True:
+            try:
+                kind, frequency, volume = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'close':
+                self.window.destroy()
+                return
+            if kind == 'response':
+                self.frequency.append(frequency)
+                self.volume.append(volume)
+                self.line.set_data(self.frequency, self.volume)
+            else:
+                self.tone.set_data([frequency], [volume])
+            changed = True
+        if changed:
+            self.blit()
+
+        # Back off when frames get expensive so drawing stays under max_load
+        cost_ms = (perf_counter() - start) * 1000
+        delay = max(self.interval_ms, int(cost_ms * (1 - self.max_load) / self.max_load))
+        self.window.after(delay, self.poll)
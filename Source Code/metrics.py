@@ -0,0 +1,123 @@
+import numpy as np
+
+from protocol import EARS
+
+FREQUENCIES = (125, 250, 500, 1000, 2000, 4000, 8000)
+
+PTA_FREQUENCIES = (500, 1000, 2000, 4000)  # 4-frequency pure-tone average
+HFA_FREQUENCIES = (2000, 4000, 8000)       # high-frequency average
+NOTCH_LOWER = (1000, 2000)                 # reference below the 4 kHz notch
+NOTCH_UPPER = (6000, 8000)                 # reference above the 4 kHz notch
+
+
+def threshold_array(df, frequencies=FREQUENCIES, value=None):
+    """Turns a long results frame into an (n_sessions, 2 ears, n_frequencies) array
+
+    ``df`` has 'ear', 'frequency' and a value column ('threshold' if present,
+    otherwise 'volume' as returned by ``analyse_results``), plus an optional
+    'session' column. Repeated values are averaged; missing cells are NaN.
+    Returns the array and the session labels along its first axis.
+    """
+    value = value or ('threshold' if 'threshold' in df else 'volume')
+    frequencies = np.asarray(frequencies)
+    if 'session' in df:
+        sessions, s_idx = np.unique(df['session'].to_numpy(), return_inverse=True)
+    else:
+        sessions, s_idx = np.array([0]), np.zeros(len(df), dtype=np.intp)
+    e_idx = df['ear'].map({ear: i for i, ear in enumerate(EARS)}).to_numpy(dtype=np.float64)
+    f_idx = np.searchsorted(frequencies, df['frequency'].to_numpy()).clip(0, len(frequencies) - 1)
+    values = df[value].to_numpy(dtype=np.float64)
+
+    keep = (frequencies[f_idx] == df['frequency'].to_numpy()) & ~np.isnan(values) & ~np.isnan(e_idx)
+    flat = (s_idx[keep] * len(EARS) + e_idx[keep].astype(np.intp)) * len(frequencies) + f_idx[keep]
+    size = len(sessions) * len(EARS) * len(frequencies)
+    sums = np.bincount(flat, weights=values[keep], minlength=size)
+    counts = np.bincount(flat, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        array = np.where(counts > 0, sums / counts, np.nan)
+    return array.reshape(len(sessions), len(EARS), len(frequencies)), sessions
+
+
+def from_thresholds(rows, frequencies=FREQUENCIES):
+    """Array for a single session from clinical threshold rows
+
+    ``rows`` are (ear, frequency, threshold, ...) tuples as returned by
+    ``LiveAnalysis.thresholds``; thresholds that are None (nothing heard)
+    and untested frequencies stay NaN. Needs no pandas.
+    """
+    frequencies = np.asarray(frequencies)
+    array = np.full((1, len(EARS), len(frequencies)), np.nan)
+    rows = [(EARS.index(ear), frequency, threshold) for ear, frequency, threshold, *_ in rows
+            if ear in EARS and threshold is not None]
+    if rows:
+        e_idx, freq, values = (np.array(column) for column in zip(*rows))
+        f_idx = np.searchsorted(frequencies, freq).clip(0, len(frequencies) - 1)
+        keep = frequencies[f_idx] == freq
+        array[0, e_idx[keep], f_idx[keep]] = values[keep]
+    return array
+
+
+def _columns(frequencies, wanted):
+    """Indexes of the wanted frequencies that exist on the array's frequency axis"""
+    frequencies = list(frequencies)
+    return [frequencies.index(f) for f in wanted if f in frequencies]
+
+
+def masked_mean(array, columns, min_count=1):
+    """Mean over the given frequency columns ignoring NaNs, NaN below ``min_count`` values"""
+    if not columns:
+        return np.full(array.shape[:-1], np.nan)
+    sub = array[..., columns]
+    present = ~np.isnan(sub)
+    count = present.sum(axis=-1)
+    total = np.where(present, sub, 0.0).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count >= min_count, total / count, np.nan)
+
+
+def compute_metrics(array, frequencies=FREQUENCIES):
+    """Computes PTA, high-frequency average, asymmetry and 4 kHz notch for every session
+
+    ``array`` is (n_sessions, 2, n_frequencies) with ears ordered as ``EARS``
+    and NaN for untested frequencies. Per-ear metrics come back with shape
+    (n_sessions, 2), interaural ones with shape (n_sessions,).
+    """
+    pta_cols = _columns(frequencies, PTA_FREQUENCIES)
+    pta = masked_mean(array, pta_cols, min_count=len(PTA_FREQUENCIES))
+    hfa = masked_mean(array, _columns(frequencies, HFA_FREQUENCIES), min_count=2)
+
+    # Interaural asymmetry: PTA difference (right minus left) and the worst single-frequency gap
+    asymmetry = pta[:, EARS.index('right')] - pta[:, EARS.index('left')]
+    gap = np.abs(array[:, 0, :] - array[:, 1, :])
+    has_gap = ~np.isnan(gap)
+    max_gap = np.where(has_gap.any(axis=1), np.where(has_gap, gap, -np.inf).max(axis=1), np.nan)
+
+    # Noise notch: how far 4 kHz dips below the mean of its neighbours
+    notch = np.full(array.shape[:2], np.nan)
+    if 4000 in frequencies:
+        lower = masked_mean(array, _columns(frequencies, NOTCH_LOWER))
+        upper = masked_mean(array, _columns(frequencies, NOTCH_UPPER))
+        notch = array[..., list(frequencies).index(4000)] - (lower + upper) / 2
+
+    return {
+        'pta': pta,
+        'hfa': hfa,
+        'asymmetry': asymmetry,
+        'max_interaural_gap': max_gap,
+        'notch_4k': notch,
+    }
+
+
+def metrics_frame(array, sessions=None, frequencies=FREQUENCIES):
+    """The metrics of ``compute_metrics`` as one DataFrame row per session"""
+    import pandas as pd
+
+    metrics = compute_metrics(array, frequencies)
+    columns = {}
+    for name, values in metrics.items():
+        if values.ndim == 2:
+            for i, ear in enumerate(EARS):
+                columns[f'{name}_{ear}'] = values[:, i]
+        else:
+            columns[name] = values
+    return pd.DataFrame(columns, index=sessions)
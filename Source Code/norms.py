@@ -0,0 +1,59 @@
+from functools import lru_cache
+from math import erf, sqrt
+
+import numpy as np
+
+# ISO 7029 (2000) coefficients for otologically normal persons, by frequency:
+# alpha (median shift per squared year above 18) for males and females, and
+# the base spreads of the upper and lower halves of the distribution.
+NORM_FREQUENCIES = np.array([125, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000])
+ALPHA = np.array([
+    [0.0030, 0.0030, 0.0035, 0.0040, 0.0055, 0.0070, 0.0115, 0.0160, 0.0180, 0.0220],  # male
+    [0.0030, 0.0030, 0.0035, 0.0040, 0.0050, 0.0060, 0.0075, 0.0090, 0.0120, 0.0150],  # female
+])
+B_UPPER = np.array([7.23, 6.67, 6.12, 6.12, 6.67, 7.23, 7.78, 8.34, 9.45, 10.56])
+B_LOWER = np.array([5.78, 5.34, 4.89, 4.89, 5.34, 5.78, 6.23, 6.67, 7.56, 8.45])
+
+SEXES = ('male', 'female')
+MIN_AGE, MAX_AGE = 18, 90
+MIN_LEVEL, MAX_LEVEL = -10, 120
+
+
+@lru_cache(maxsize=None)
+def percentile_table():
+    """Percentile (0-100) of every 1 dB hearing level among age/sex peers
+
+    Shape is (sex, age, frequency, level) as uint8, about 190 kB, built once
+    per process. A value of 90 means 90 % of otologically normal peers hear
+    better than that level.
+    """
+    ages = np.arange(MIN_AGE, MAX_AGE + 1)
+    levels = np.arange(MIN_LEVEL, MAX_LEVEL + 1)
+    median = ALPHA[:, None, :] * (ages[None, :, None] - 18) ** 2
+    spread_up = B_UPPER + 0.445 * median
+    spread_down = B_LOWER + 0.356 * median
+    diff = levels - median[..., None]
+    z = np.where(diff > 0, diff / spread_up[..., None], diff / spread_down[..., None])
+    cdf = 0.5 * (1 + np.vectorize(erf, otypes=[float])(z / sqrt(2)))
+    return np.rint(100 * cdf).astype(np.uint8)
+
+
+def percentiles(age, sex, frequency, level):
+    """Looks up peer percentiles; every argument may be a scalar or an array
+
+    Broadcasting turns a whole result set into one fancy-index access of the
+    table. ``sex`` is 'male'/'female' or 0/1. Frequencies outside the ISO 7029
+    set and missing levels give NaN.
+    """
+    sex = np.asarray(sex)
+    if sex.dtype.kind in 'UO':
+        sex = (sex == 'female').astype(np.intp)
+    age = np.clip(np.rint(np.asarray(age, dtype=np.float64)), MIN_AGE, MAX_AGE).astype(np.intp) - MIN_AGE
+    frequency = np.asarray(frequency)
+    f_idx = np.searchsorted(NORM_FREQUENCIES, frequency).clip(0, len(NORM_FREQUENCIES) - 1)
+    level = np.asarray(level, dtype=np.float64)
+    missing = np.isnan(level) | (NORM_FREQUENCIES[f_idx] != frequency)
+    l_idx = np.clip(np.rint(np.nan_to_num(level)), MIN_LEVEL, MAX_LEVEL).astype(np.intp) - MIN_LEVEL
+
+    values = percentile_table()[sex, age, f_idx, l_idx]
+    return np.where(missing, np.nan, values)
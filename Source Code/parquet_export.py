@@ -0,0 +1,219 @@
+"""Exports the session database to a partitioned Parquet dataset for fleet analytics
+
+Each device appends its new sessions to a shared folder laid out as
+``<table>/month=YYYY-MM/device=<name>/part-<first>-<last session>.parquet``
+for the tables ``sessions``, ``thresholds`` and ``trials``. Text columns such
+as ear, flag and patient are dictionary encoded and come back as
+categoricals. Running it again only exports the sessions added since the
+last run; the parts of a month are compacted into one file once the month is
+over, or sooner when they pile up, so appending after every test stays cheap
+to read.
+
+Usage: python parquet_export.py [-d sessions.db] [-o fleet] [--device NAME] [--max-parts 32]
+"""
+import argparse
+import json
+import os
+import re
+import socket
+from datetime import datetime
+
+from session_store import SessionStore
+
+PART = re.compile(r'^part-(\d+)-(\d+)\.parquet$')
+MAX_PARTS = 32  # parts an open month may collect before it is compacted anyway
+
+# Column kinds: 'category' is dictionary encoded, 'timestamp' is parsed from ISO text
+TABLES = {
+    'sessions': (
+        [('session_id', 'int64'), ('patient_id', 'category'), ('started', 'timestamp'), ('protocol', 'category'),
+         ('scheme', 'category'), ('age', 'int16'), ('sex', 'category')],
+        'SELECT s.id, s.patient_id, s.started, s.protocol, s.scheme, p.age, p.sex, substr(s.started, 1, 7) '
+        'FROM sessions s LEFT JOIN patients p ON p.id = s.patient_id WHERE s.id > ? ORDER BY s.id'),
+    'thresholds': (
+        [('session_id', 'int64'), ('patient_id', 'category'), ('started', 'timestamp'), ('ear', 'category'),
+         ('frequency', 'int32'), ('threshold', 'float32'), ('n_runs', 'int16'), ('n_responses', 'int16'),
+         ('flag', 'category')],
+        'SELECT t.session_id, s.patient_id, t.started, t.ear, t.frequency, t.threshold, t.n_runs, t.n_responses, '
+        't.flag, substr(t.started, 1, 7) FROM thresholds t JOIN sessions s ON s.id = t.session_id '
+        'WHERE t.session_id > ? ORDER BY t.session_id, t.ear, t.frequency'),
+    'trials': (
+        [('session_id', 'int64'), ('ear', 'category'), ('run', 'int16'), ('frequency', 'int32'),
+         ('volume', 'int16'), ('played', 'timestamp'), ('heard', 'timestamp')],
+        'SELECT tr.session_id, tr.ear, tr.run, tr.frequency, tr.volume, tr.played, tr.heard, substr(s.started, 1, 7) '
+        'FROM trials tr JOIN sessions s ON s.id = tr.session_id WHERE tr.session_id > ? ORDER BY tr.session_id, tr.rowid'),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('pyarrow is needed for the Parquet export (pip install pyarrow)') from None
+    return pyarrow
+
+
+def _state_path(root, device):
+    # Parquet readers skip names starting with '_'
+    return os.path.join(root, '_exported', f'{device}.json')
+
+
+def _table(pa, columns, rows):
+    """Arrow table of ``rows`` with the column kinds of TABLES"""
+    arrays = []
+    for (name, kind), values in zip(columns, zip(*rows)):
+        if kind == 'category':
+            arrays.append(pa.array(values, pa.string()).dictionary_encode())
+        elif kind == 'timestamp':
+            arrays.append(pa.array(values, pa.string()).cast(pa.timestamp('us')))
+        else:
+            arrays.append(pa.array(values, getattr(pa, kind)()))
+    return pa.Table.from_arrays(arrays, names=[name for name, _ in columns])
+
+
+def _write(pa, table, folder, first, last):
+    """Writes the part holding sessions ``first`` to ``last`` of a partition folder"""
+    os.makedirs(folder, exist_ok=True)
+    name = f'part-{first:09d}-{last:09d}.parquet'
+    # Written under a hidden name first, so readers never see half a file
+    temporary = os.path.join(folder, '.' + name)
+    pa.parquet.write_table(table, temporary, compression='zstd')
+    os.replace(temporary, os.path.join(folder, name))
+
+
+def _parts(folder):
+    """(first, last, name) of the parts of a partition folder, dropping the redundant ones
+
+    A part whose sessions all lie in another part was left behind by an
+    interrupted export or compaction and is removed.
+    """
+    parts = sorted(((int(m[1]), int(m[2]), m[0]) for m in map(PART.match, os.listdir(folder)) if m),
+                   key=lambda part: (part[0], -part[1]))
+    kept = []
+    for part in parts:
+        if kept and part[1] <= kept[-1][1]:
+            os.remove(os.path.join(folder, part[2]))
+        else:
+            kept.append(part)
+    return kept
+
+
+def compact(root, device=None, closed_before=None, max_parts=MAX_PARTS):
+    """Merges the parts of a device's month partitions into one file each
+
+    A partition is compacted when its month is before ``closed_before``
+    ('YYYY-MM', default the current month) and it has more than one part,
+    or when it has ``max_parts`` parts. Returns the partitions rewritten.
+    """
+    pa = _pyarrow()
+    device = device or socket.gethostname()
+    closed_before = closed_before or f'{datetime.now():%Y-%m}'
+    compacted = 0
+    for table in TABLES:
+        if not os.path.isdir(os.path.join(root, table)):
+            continue
+        for month_folder in sorted(os.listdir(os.path.join(root, table))):
+            folder = os.path.join(root, table, month_folder, f'device={device}')
+            if not month_folder.startswith('month=') or not os.path.isdir(folder):
+                continue
+            parts = _parts(folder)
+            closed = month_folder[len('month='):] < closed_before
+            if len(parts) < 2 or (not closed and len(parts) < max_parts):
+                continue
+            merged = pa.concat_tables([pa.parquet.read_table(os.path.join(folder, name)) for _, _, name in parts])
+            _write(pa, merged.unify_dictionaries().combine_chunks(), folder, parts[0][0], parts[-1][1])
+            # The merged part covers all of them
+            for _, _, name in parts:
+                os.remove(os.path.join(folder, name))
+            compacted += 1
+    return compacted
+
+
+def export_sessions(store, root, device=None, max_parts=MAX_PARTS):
+    """Appends the sessions of ``store`` not exported yet to the dataset at ``root``
+
+    Every month of new sessions becomes one part per table. The last
+    exported session is remembered per device only after all parts are in
+    place; an interrupted export is redone and its part replaces the one
+    left behind. Months before the newest exported session are then
+    compacted (see ``compact``). Returns the number of sessions exported.
+    """
+    pa = _pyarrow()
+    device = device or socket.gethostname()
+    state_path = _state_path(root, device)
+    last = 0
+    if os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            last = json.load(f)['last_session']
+
+    newest = store.connection.execute('SELECT max(id) FROM sessions').fetchone()[0]
+    if newest is None or newest <= last:
+        return 0
+
+    for table, (columns, query) in TABLES.items():
+        months = {}
+        for row in store.connection.execute(query, (last,)):
+            months.setdefault(row[-1], []).append(row[:-1])
+        for month, rows in months.items():
+            folder = os.path.join(root, table, f'month={month}', f'device={device}')
+            _write(pa, _table(pa, columns, rows), folder, rows[0][0], rows[-1][0])
+
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'last_session': newest, 'exported': datetime.now().isoformat()}, f)
+    os.replace(state_path + '.tmp', state_path)
+
+    # The device's clock only moves forward: a month is over once a later one has sessions
+    newest_month = store.connection.execute('SELECT substr(started, 1, 7) FROM sessions WHERE id = ?', (newest,)).fetchone()[0]
+    compact(root, device, newest_month, max_parts)
+    return store.connection.execute('SELECT count(*) FROM sessions WHERE id > ?', (last,)).fetchone()[0]
+
+
+def load_fleet(root, table='thresholds', since=None, until=None, devices=None, columns=None):
+    """Loads a table of the dataset as a DataFrame
+
+    ``since`` (inclusive) and ``until`` (exclusive) are dates or ISO strings
+    and ``devices`` a list of device names; only the matching month/device
+    folders are read. Dictionary-encoded columns become categoricals.
+    """
+    pa = _pyarrow()
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('month', pa.string()), ('device', pa.string())]), flavor='hive')
+    dataset = ds.dataset(os.path.join(root, table), format='parquet', partitioning=partitioning)
+    time_column = 'played' if table == 'trials' else 'started'
+
+    conditions = []
+    if since is not None:
+        since = datetime.fromisoformat(str(since))
+        conditions += [ds.field('month') >= f'{since:%Y-%m}', ds.field(time_column) >= pa.scalar(since, pa.timestamp('us'))]
+    if until is not None:
+        until = datetime.fromisoformat(str(until))
+        conditions += [ds.field('month') <= f'{until:%Y-%m}', ds.field(time_column) < pa.scalar(until, pa.timestamp('us'))]
+    if devices is not None:
+        conditions.append(ds.field('device').isin(list(devices)))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append new sessions to a partitioned Parquet dataset')
+    parser.add_argument('-d', '--db', default='./sessions.db', help='Session database to export')
+    parser.add_argument('-o', '--output', default='./fleet', help='Root folder of the dataset (can be shared by devices)')
+    parser.add_argument('--device', default=None, help='Device name used as partition (default: host name)')
+    parser.add_argument('--max-parts', type=int, default=MAX_PARTS, help='Parts a month collects before it is compacted early')
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    try:
+        count = export_sessions(store, args.output, args.device, args.max_parts)
+    finally:
+        store.close()
+    print(f'{count} new sessions exported to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import json
+import os
+
+import numpy as np
+
+DEFAULT_PROTOCOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'protocols', 'standard.json')
+
+EARS = ('left', 'right')
+STEP_RULES = ('ascending',)
+TONE_TYPES = ('pure', 'pulsed')
+
+
+def load_protocol(path=DEFAULT_PROTOCOL):
+    """Reads a protocol definition from a JSON, TOML or YAML file"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path, encoding='utf-8') as f:
+            spec = json.load(f)
+    elif ext == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            spec = tomllib.load(f)
+    elif ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Protocol {path}: PyYAML is needed to read YAML protocols (pip install pyyaml)")
+        with open(path, encoding='utf-8') as f:
+            spec = yaml.safe_load(f)
+    else:
+        raise ValueError(f"Protocol {path}: unsupported file type '{ext}' (use .json, .toml or .yaml)")
+    return validate_protocol(spec, path)
+
+
+def _is_number(value):
+    # bool is an int subclass, but true/false is never a valid number here
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_integer(value):
+    return _is_number(value) and float(value).is_integer()
+
+
+def _section(spec, name, errors):
+    """A nested mapping of the protocol, or None (with an error) when it is not one"""
+    section = spec.get(name, {})
+    if not isinstance(section, dict):
+        errors.append(f"'{name}' must be a mapping")
+        return None
+    return section
+
+
+def validate_protocol(spec, source='<protocol>'):
+    """Checks a protocol definition and fills in defaults
+
+    Raises ValueError listing every problem found, so a protocol file can be
+    fixed in one go. Types are checked before values are compared, so a
+    malformed file never fails with another exception.
+    """
+    errors = []
+    if not isinstance(spec, dict):
+        raise ValueError(f"Protocol {source}: expected a mapping at the top level")
+
+    ears = spec.get('ears', ['right'])
+    if (not isinstance(ears, list) or not ears or any(ear not in EARS for ear in ears)
+            or len(set(ears)) < len(ears)):
+        errors.append(f"'ears' must be a non-empty list of {EARS}, each at most once")
+
+    frequencies = spec.get('frequencies')
+    if (not isinstance(frequencies, list) or not frequencies
+            or any(not _is_integer(f) or f <= 0 for f in frequencies)):
+        errors.append("'frequencies' must be a non-empty list of positive whole numbers (Hz)")
+        frequencies = None
+    else:
+        frequencies = [int(f) for f in frequencies]
+
+    levels = _section(spec, 'levels', errors)
+    start = stop = step = None
+    if levels is not None:
+        start, stop, step = levels.get('start', 0), levels.get('stop'), levels.get('step', 10)
+        # Volumes are whole dB steps (the schedule holds them as integers)
+        if not all(_is_integer(v) for v in (start, stop, step)) or step <= 0 or stop < start:
+            errors.append("'levels' needs whole numbers 'start' <= 'stop' and a positive 'step' (dB)")
+        else:
+            start, stop, step = int(start), int(stop), int(step)
+
+    if spec.get('step_rule', 'ascending') not in STEP_RULES:
+        errors.append(f"'step_rule' must be one of {STEP_RULES}")
+
+    repeat = spec.get('repeat', 1)
+    if not isinstance(repeat, int) or isinstance(repeat, bool) or repeat < 1:
+        errors.append("'repeat' must be a positive integer")
+
+    tone = _section(spec, 'tone', errors)
+    if tone is not None:
+        duration, sample_rate, ramp = tone.get('duration', 0.5), tone.get('sample_rate', 44100), tone.get('ramp', 0.0)
+        if tone.get('type', 'pure') not in TONE_TYPES:
+            errors.append(f"'tone.type' must be one of {TONE_TYPES}")
+        if not _is_number(duration) or duration <= 0 or not _is_integer(sample_rate) or sample_rate <= 0:
+            errors.append("'tone.duration' must be a positive number and 'tone.sample_rate' a positive integer")
+        elif frequencies and max(frequencies) >= sample_rate / 2:
+            errors.append("'frequencies' must stay below half the sample rate")
+        if not _is_number(ramp) or ramp < 0 or (_is_number(duration) and 2 * ramp > duration):
+            errors.append("'tone.ramp' must be a number that fits twice into the tone duration")
+        pulses = tone.get('pulses', 3)
+        if tone.get('type') == 'pulsed' and (not isinstance(pulses, int) or isinstance(pulses, bool) or pulses < 1):
+            errors.append("'tone.pulses' must be a positive integer")
+
+    if not isinstance(spec.get('early_stop', False), bool):
+        errors.append("'early_stop' must be true or false")
+
+    isi = _section(spec, 'isi', errors)
+    if isi is not None:
+        pauses = (isi.get('level', 2.0), isi.get('frequency', 2.0))
+        if not all(_is_number(p) for p in pauses) or min(pauses) < 0:
+            errors.append("'isi' pauses must be numbers and cannot be negative")
+
+    name = spec.get('name', os.path.splitext(os.path.basename(source))[0])
+    if not isinstance(name, str):
+        errors.append("'name' must be text")
+
+    if errors:
+        raise ValueError(f"Protocol {source} is invalid:\n  - " + '\n  - '.join(errors))
+
+    return {
+        'name': name,
+        'ears': list(ears),
+        'frequencies': list(frequencies),
+        'levels': {'start': start, 'stop': stop, 'step': step},
+        'step_rule': spec.get('step_rule', 'ascending'),
+        'repeat': repeat,
+        'early_stop': spec.get('early_stop', False),
+        'tone': {
+            'type': tone.get('type', 'pure'),
+            'duration': tone.get('duration', 0.5),
+            'sample_rate': int(tone.get('sample_rate', 44100)),
+            'ramp': tone.get('ramp', 0.0),
+            'pulses': tone.get('pulses', 3),
+        },
+        'isi': {'level': isi.get('level', 2.0), 'frequency': isi.get('frequency', 2.0)},
+    }
+
+
+class Schedule:
+    """A validated protocol compiled into arrays and ready-made tone buffers
+
+    The runtime walks positions ``(step, level)``: ``step`` indexes the
+    repeated frequency list and ``level`` the volume list. Tones are
+    synthesised once per ear and frequency, so playing a trial is a single
+    gain multiplication.
+    """
+
+    def __init__(self, spec, repeat=None, early_stop=None):
+        self.name = spec['name']
+        self.ears = tuple(spec['ears'])
+        self.step_rule = spec['step_rule']
+        self.repeat = repeat or spec['repeat']
+        self.early_stop = spec['early_stop'] if early_stop is None else early_stop
+        self.base_frequencies = np.array(spec['frequencies'], dtype=np.int32)
+        self.frequencies = np.repeat(self.base_frequencies, self.repeat)
+        levels = spec['levels']
+        self.volumes = np.arange(levels['start'], levels['stop'] + 1, levels['step'], dtype=np.int32)
+        self.gains = (10 ** (self.volumes / 20)).astype(np.float32)
+        self.tone_type = spec['tone']['type']
+        self.sample_rate = spec['tone']['sample_rate']
+        self.duration = spec['tone']['duration']
+        self.level_pause = spec['isi']['level']
+        self.frequency_pause = spec['isi']['frequency']
+        self.channels = 2
+        self._tones = {ear: {} for ear in self.ears}
+        unit = self._envelope(spec['tone'])
+        t = np.arange(unit.size) / self.sample_rate
+        for freq in self.base_frequencies:
+            mono = (np.sin(2 * np.pi * freq * t) * unit).astype(np.float32)
+            for ear in self.ears:
+                stereo = np.zeros((mono.size, 2), dtype=np.float32)
+                stereo[:, EARS.index(ear)] = mono
+                self._tones[ear][int(freq)] = stereo.ravel()
+
+    def _envelope(self, tone):
+        """Amplitude envelope (ramps and pulses) shared by every frequency"""
+        n = int(self.sample_rate * tone['duration'])
+        ramp = int(self.sample_rate * tone['ramp'])
+        if tone['type'] == 'pulsed':
+            # Equal on/off periods, starting and ending with a pulse
+            period = n // (2 * tone['pulses'] - 1)
+            envelope = np.zeros(n, dtype=np.float32)
+            pulse = self._ramped(period, min(ramp, period // 2))
+            for k in range(tone['pulses']):
+                envelope[2 * k * period:(2 * k + 1) * period] = pulse
+            return envelope
+        return self._ramped(n, ramp)
+
+    @staticmethod
+    def _ramped(n, ramp):
+        """Flat envelope of ``n`` samples with raised-cosine on/off ramps"""
+        envelope = np.ones(n, dtype=np.float32)
+        if ramp:
+            rise = 0.5 - 0.5 * np.cos(np.pi * np.arange(ramp) / ramp)
+            envelope[:ramp] = rise
+            envelope[n - ramp:] = rise[::-1]
+        return envelope
+
+    def __len__(self):
+        return len(self.frequencies)
+
+    def audio(self, ear, step, level):
+        """Returns the float32 stereo samples for one presentation"""
+        return self._tones[ear][int(self.frequencies[step])] * self.gains[level]
+
+    def next_position(self, step, level, heard):
+        """Where the ascending procedure goes after a trial, None when finished"""
+        if heard or level + 1 >= len(self.volumes):
+            step, level = step + 1, 0
+        else:
+            level += 1
+        return (step, level) if step < len(self.frequencies) else None
+
+    def skip_repeats(self, step):
+        """First position of the next frequency, skipping the remaining repeats of this one"""
+        step = (step // self.repeat + 1) * self.repeat
+        return (step, 0) if step < len(self.frequencies) else None
+
+
+def compile_protocol(path=DEFAULT_PROTOCOL, repeat=None, early_stop=None):
+    """Loads, validates and compiles a protocol file into a Schedule"""
+    return Schedule(load_protocol(path), repeat=repeat, early_stop=early_stop)
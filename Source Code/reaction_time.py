@@ -0,0 +1,95 @@
+import random
+
+FAST_MS = 150    # quicker than this is an anticipation, not a response to the tone
+SLOW_MS = 2500   # later than the tone plus its pause belongs to no tone at all
+OUTLIER_SD = 3   # distance from the running mean that marks an outlier
+MIN_FOR_OUTLIER = 5
+
+
+class RunningStats:
+    """Streaming mean/variance (Welford) with a small reservoir for the median"""
+
+    __slots__ = ('n', 'mean', '_m2', 'reservoir', 'size', '_rng')
+
+    def __init__(self, size=31, seed=None):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.reservoir = []
+        self.size = size
+        self._rng = random.Random(seed)
+
+    def add(self, x):
+        """Adds one value in O(1)"""
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+        # Reservoir sampling keeps a uniform sample of fixed size
+        if len(self.reservoir) < self.size:
+            self.reservoir.append(x)
+        else:
+            j = self._rng.randrange(self.n)
+            if j < self.size:
+                self.reservoir[j] = x
+
+    @property
+    def variance(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+    @property
+    def median(self):
+        """Median of the reservoir (exact while fewer than ``size`` values were added)"""
+        if not self.reservoir:
+            return None
+        values = sorted(self.reservoir)
+        mid = len(values) // 2
+        return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+class ReactionTimeTracker:
+    """Keeps reaction-time statistics overall, per volume level and per frequency"""
+
+    def __init__(self, fast_ms=FAST_MS, slow_ms=SLOW_MS):
+        self.fast_ms = fast_ms
+        self.slow_ms = slow_ms
+        self.overall = RunningStats()
+        self.by_level = {}
+        self.by_frequency = {}
+        self.flagged = []
+
+    def add(self, frequency, volume, reaction_ms):
+        """Records one response and returns its flag: ok, too_fast, too_slow or outlier"""
+        if reaction_ms < self.fast_ms:
+            flag = 'too_fast'
+        elif reaction_ms > self.slow_ms:
+            flag = 'too_slow'
+        elif (self.overall.n >= MIN_FOR_OUTLIER and self.overall.std > 0
+              and abs(reaction_ms - self.overall.mean) > OUTLIER_SD * self.overall.std):
+            flag = 'outlier'
+        else:
+            flag = 'ok'
+
+        if flag in ('too_fast', 'too_slow'):
+            # Implausible responses would only distort the statistics
+            self.flagged.append((frequency, volume, reaction_ms, flag))
+            return flag
+        if flag == 'outlier':
+            self.flagged.append((frequency, volume, reaction_ms, flag))
+
+        self.overall.add(reaction_ms)
+        self.by_level.setdefault(volume, RunningStats()).add(reaction_ms)
+        self.by_frequency.setdefault(frequency, RunningStats()).add(reaction_ms)
+        return flag
+
+    def summary(self):
+        """Rows of (group, key, count, mean, std, median) for display or export"""
+        rows = [('overall', 'all', self.overall)]
+        rows += [('volume', key, stats) for key, stats in sorted(self.by_level.items())]
+        rows += [('frequency', key, stats) for key, stats in sorted(self.by_frequency.items())]
+        return [(group, key, s.n, round(s.mean, 1), round(s.std, 1), s.median and round(s.median, 1))
+                for group, key, s in rows]
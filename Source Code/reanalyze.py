@@ -0,0 +1,144 @@
+"""Re-runs threshold extraction and classification over stored result files
+
+Usage: python reanalyze.py [folders ...] [-o summary.csv] [-j workers] [--resume]
+"""
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from classification import SCHEMES, classify
+from protocol import DEFAULT_PROTOCOL, load_protocol
+from thresholds import extract_thresholds
+
+RESULT_FILE = re.compile(r'^results_(?P<ear>left|right)_(?P<session>\d{14})(?:_data)?\.(?P<ext>csv|xlsx)$')
+
+# Column names of the Excel sheet written by analyse_results
+EXCEL_COLUMNS = {'Pitch (Frequency Hz)': 'frequency', 'Hearing Level (Volume dB)': 'volume'}
+
+
+def discover(folders, recursive=False):
+    """Finds result files, keeping the CSV when a session also has an Excel sheet"""
+    found = {}
+    for folder in folders:
+        walker = os.walk(folder) if recursive else [(folder, [], os.listdir(folder))]
+        for root, _, names in walker:
+            for name in names:
+                match = RESULT_FILE.match(name)
+                if not match:
+                    continue
+                key = (root, match['ear'], match['session'])
+                if key not in found or match['ext'] == 'csv':
+                    found[key] = os.path.join(root, name)
+    return sorted(found.values())
+
+
+def read_responses(path):
+    """Reads the (frequency, volume, played) response rows of one result file"""
+    if path.endswith('.csv'):
+        df = pd.read_csv(path, usecols=lambda c: c in ('frequency', 'volume', 'played'))
+    else:
+        df = pd.read_excel(path).rename(columns=EXCEL_COLUMNS)
+    df = df[[c for c in ('frequency', 'volume', 'played') if c in df]]
+    # Several clicks on one tone are stored as separate rows of the same trial
+    return df.drop_duplicates() if 'played' in df else df
+
+
+def responses_to_trials(df, volumes):
+    """Expands response rows into the full log of the ascending procedure
+
+    Every response is one ascending run: all levels below it were presented
+    and missed, the level itself was heard.
+    """
+    volumes = np.asarray(volumes)
+    counts = np.searchsorted(volumes, df['volume'].to_numpy(), side='right')
+    row = np.repeat(np.arange(len(df)), counts)
+    offset = np.arange(len(row)) - np.repeat(np.cumsum(counts) - counts, counts)
+    level = volumes[offset]
+    return pd.DataFrame({
+        'run': row,
+        'frequency': df['frequency'].to_numpy()[row],
+        'volume': level,
+        'heard': level == df['volume'].to_numpy()[row],
+    })
+
+
+def analyse_files(paths, volumes, scheme):
+    """Worker: extracts and classifies thresholds for a chunk of files"""
+    frames = []
+    for path in paths:
+        match = RESULT_FILE.match(os.path.basename(path))
+        try:
+            trials = responses_to_trials(read_responses(path), volumes)
+        except (OSError, ValueError, KeyError) as e:
+            print(f'\nSkipping {path}: {e}', file=sys.stderr)
+            continue
+        trials.insert(0, 'ear', match['ear'])
+        trials.insert(0, 'session', match['session'])
+        trials.insert(0, 'file', path)
+        frames.append(trials)
+    if not frames:
+        return paths, None
+    result = extract_thresholds(pd.concat(frames, ignore_index=True))
+    result['hearing_loss_range'] = classify(result['threshold'], scheme)
+    return paths, result
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-analyse stored hearing test result files')
+    parser.add_argument('folders', nargs='*', default=['.'], help='Folders containing results_<ear>_<timestamp> files')
+    parser.add_argument('-o', '--output', default='reanalysis_summary.csv', help='Consolidated summary CSV')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('-c', '--chunk-size', type=int, default=32, help='Files handed to a worker at a time')
+    parser.add_argument('-p', '--protocol', default=DEFAULT_PROTOCOL, help='Protocol the files were recorded with')
+    parser.add_argument('-s', '--scheme', choices=sorted(SCHEMES), default='default', help='Hearing loss classification scheme')
+    parser.add_argument('--recursive', action='store_true', help='Search sub-folders as well')
+    parser.add_argument('--resume', action='store_true', help='Skip files already in the summary')
+    args = parser.parse_args()
+
+    levels = load_protocol(args.protocol)['levels']
+    volumes = np.arange(levels['start'], levels['stop'] + 1, levels['step'])
+    done_path = args.output + '.done'
+
+    paths = discover(args.folders, args.recursive)
+    done = set()
+    if args.resume and os.path.exists(done_path):
+        with open(done_path, encoding='utf-8') as f:
+            done = set(f.read().splitlines())
+        # Drop rows of a chunk that was written but not marked done
+        if os.path.exists(args.output):
+            summary = pd.read_csv(args.output)
+            summary[summary['file'].isin(done)].to_csv(args.output, index=False)
+    else:
+        for path in (args.output, done_path):
+            if os.path.exists(path):
+                os.remove(path)
+    todo = [p for p in paths if p not in done]
+    print(f'{len(paths)} result files found, {len(todo)} to analyse with {args.workers} workers')
+
+    processed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, open(done_path, 'a', encoding='utf-8') as done_file:
+        futures = [pool.submit(analyse_files, chunk, volumes, args.scheme) for chunk in chunked(todo, args.chunk_size)]
+        for future in as_completed(futures):
+            chunk, result = future.result()
+            if result is not None:
+                header = not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+                result.to_csv(args.output, mode='a', header=header, index=False)
+            done_file.write(''.join(path + '\n' for path in chunk))
+            done_file.flush()
+            processed += len(chunk)
+            print(f'\r[{processed}/{len(todo)}] files analysed', end='', file=sys.stderr)
+    print(file=sys.stderr)
+    print(f'Summary written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
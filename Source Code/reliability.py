@@ -0,0 +1,65 @@
+import numpy as np
+
+# Two-sided 95 % t critical values by degrees of freedom (1.96 beyond the table)
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042}
+
+AGREEMENT_DB = 5  # a repeat agrees when it lies this close to its frequency's mean
+
+
+def t_critical(dof):
+    """95 % t critical value, using the nearest tabulated degrees of freedom below"""
+    known = [d for d in T_95 if d <= dof]
+    return T_95[max(known)] if dof <= 30 and known else 1.96
+
+
+def repeat_statistics(frequency, level, agreement_db=AGREEMENT_DB):
+    """Within-session variability of repeated presentations of each frequency
+
+    ``frequency`` and ``level`` are the response columns of one ear (for
+    example a SessionResult). Returns rows of (frequency, n, mean, std,
+    ci_low, ci_high) and the overall reliability score: the share of
+    repeats within ``agreement_db`` of their frequency's mean (NaN when no
+    frequency was repeated).
+    """
+    frequency = np.asarray(frequency)
+    level = np.asarray(level, dtype=np.float64)
+    freqs, inverse, n = np.unique(frequency, return_inverse=True, return_counts=True)
+    mean = np.bincount(inverse, weights=level) / n
+    deviation = level - mean[inverse]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(np.bincount(inverse, weights=deviation ** 2) / (n - 1))
+    std[n < 2] = np.nan
+    half = np.array([t_critical(k - 1) if k > 1 else np.nan for k in n]) * std / np.sqrt(n)
+
+    repeated = n[inverse] > 1
+    score = np.mean(np.abs(deviation[repeated]) <= agreement_db) if repeated.any() else np.nan
+    rows = list(zip(freqs.tolist(), n.tolist(), mean.round(1).tolist(), std.round(1).tolist(),
+                    (mean - half).round(1).tolist(), (mean + half).round(1).tolist()))
+    return rows, score
+
+
+class StabilityTracker:
+    """Tells the player when a frequency's repeats agree well enough to stop early
+
+    A frequency is stable once its last ``min_repeats`` responses lie within
+    ``tolerance_db`` of each other; with the default values that is two
+    responses at the same level, which already meets the 2-of-3 threshold
+    rule. Each update is O(1).
+    """
+
+    def __init__(self, min_repeats=2, tolerance_db=0):
+        self.min_repeats = min_repeats
+        self.tolerance_db = tolerance_db
+        self.recent = {}
+
+    def add(self, ear, frequency, level):
+        """Adds a response and returns whether the frequency is now stable"""
+        recent = self.recent.setdefault((ear, int(frequency)), [])
+        recent.append(level)
+        del recent[:-self.min_repeats]
+        return self.is_stable(ear, frequency)
+
+    def is_stable(self, ear, frequency):
+        recent = self.recent.get((ear, int(frequency)), [])
+        return len(recent) >= self.min_repeats and max(recent) - min(recent) <= self.tolerance_db
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import numpy as np
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from audiogram import bilateral_template, session_frequencies
+from protocol import EARS
+
+A4 = (8.27, 11.69)
+REPORT_DPI = 150  # resolution of the audiogram on the summary page
+ROWS_PER_PAGE = 40
+
+THRESHOLD_HEADERS = ['Ear', 'Frequency (Hz)', 'Threshold (dB)', 'Runs', 'Responses', 'Flag', 'Hearing Loss Range']
+REACTION_HEADERS = ['Ear', 'Group', 'Key', 'Count', 'Mean (ms)', 'Std (ms)', 'Median (ms)']
+
+
+def _format_metric(value):
+    """'right 25.0 dB, left 30.0 dB' for per-ear values, '5.0 dB' for session values"""
+    if np.ndim(value):
+        return ', '.join(f'{ear} {v:.1f} dB' if not np.isnan(v) else f'{ear} n/a' for ear, v in zip(EARS, value))
+    return f'{value:.1f} dB' if not np.isnan(value) else 'n/a'
+
+
+def summary_page(results, metadata, metrics=None, dpi=REPORT_DPI):
+    """First page: session details, the bilateral audiogram and the summary metrics"""
+    fig = Figure(figsize=A4)
+    fig.text(0.5, 0.95, 'Portable Self Assessment Audiometer - Hearing Test Report',
+             ha='center', fontsize=15, fontweight='bold')
+    for i, (label, value) in enumerate(metadata):
+        fig.text(0.08, 0.91 - 0.022 * i, f'{label}:', fontsize=10, fontweight='bold')
+        fig.text(0.32, 0.91 - 0.022 * i, str(value), fontsize=10)
+
+    if results:
+        # The audiogram comes straight from the cached template's pixels
+        ears = tuple(ear for ear in ('right', 'left') if ear in results)
+        template = bilateral_template(ears, tuple(session_frequencies(results)), dpi=dpi)
+        pixels = template.pixels(*((results[ear]['frequency'], results[ear]['volume']) for ear in ears))
+        ax = fig.add_axes([0.06, 0.28, 0.88, 0.46])
+        ax.imshow(pixels.copy(), interpolation='none')
+        ax.axis('off')
+
+    if metrics:
+        fig.text(0.08, 0.24, 'Summary', fontsize=12, fontweight='bold')
+        for i, (name, values) in enumerate(metrics.items()):
+            fig.text(0.08, 0.215 - 0.022 * i, f'{name}:', fontsize=10, fontweight='bold')
+            fig.text(0.32, 0.215 - 0.022 * i, _format_metric(values[0]), fontsize=10)
+    return fig
+
+
+def table_pages(title, headers, rows):
+    """Pages with a table of ``rows``, split every ROWS_PER_PAGE rows"""
+    for start in range(0, max(len(rows), 1), ROWS_PER_PAGE):
+        chunk = [['' if v is None else v for v in row] for row in rows[start:start + ROWS_PER_PAGE]]
+        fig = Figure(figsize=A4)
+        fig.text(0.5, 0.95, title if start == 0 else f'{title} (continued)', ha='center', fontsize=13, fontweight='bold')
+        ax = fig.add_axes([0.05, 0.05, 0.9, 0.87])
+        ax.axis('off')
+        if chunk:
+            table = ax.table(cellText=chunk, colLabels=headers, loc='upper center', cellLoc='center')
+            table.auto_set_font_size(False)
+            table.set_fontsize(9)
+            table.auto_set_column_width(range(len(headers)))
+        else:
+            ax.text(0.5, 0.9, 'No data', ha='center')
+        yield fig
+
+
+def write_report(path, results, thresholds, metadata, metrics=None, reactions=None, dpi=REPORT_DPI):
+    """Streams the clinical report of a session into one PDF, page by page
+
+    ``results`` maps ears to SessionResults, ``thresholds`` are the rows of
+    ``LiveAnalysis.thresholds()``, ``metadata`` (label, value) pairs,
+    ``metrics`` the output of ``compute_metrics`` and ``reactions`` maps
+    ears to ``ReactionTimeTracker.summary()`` rows. No image is written to
+    disk on the way.
+    """
+    reaction_rows = [(ear,) + tuple(row) for ear, rows in (reactions or {}).items() for row in rows]
+    with PdfPages(path, metadata={'Title': 'Hearing Test Report', 'CreationDate': datetime.now().astimezone()}) as pdf:
+        pdf.savefig(summary_page(results, metadata, metrics, dpi))
+        for fig in table_pages('Hearing Thresholds', THRESHOLD_HEADERS, list(thresholds)):
+            pdf.savefig(fig)
+        if reaction_rows:
+            for fig in table_pages('Reaction Times', REACTION_HEADERS, reaction_rows):
+                pdf.savefig(fig)
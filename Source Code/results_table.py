@@ -0,0 +1,77 @@
+import tkinter as tk
+from operator import itemgetter
+from tkinter import ttk
+
+
+class ResultsTable:
+    """Sortable table of result rows shown in a ttk.Treeview
+
+    Only ``height`` Treeview items exist: scrolling writes the visible slice
+    of ``rows`` into them instead of inserting one widget (or item) per row,
+    so scrolling and sorting cost the same for ten rows or a patient's whole
+    history. Click a heading to sort by that column, click again to reverse.
+    """
+
+    def __init__(self, master, headers, rows, height=20):
+        self.headers = list(headers)
+        self.rows = list(rows)
+        self.height = min(height, max(len(self.rows), 1))
+        self.offset = 0
+        self.sort_column = None
+        self.descending = False
+
+        self.frame = ttk.Frame(master)
+        self.tree = ttk.Treeview(self.frame, columns=list(range(len(self.headers))), show='headings',
+                                 height=self.height, selectmode='none')
+        for i, header in enumerate(self.headers):
+            self.tree.heading(i, text=header, command=lambda i=i: self.sort(i))
+            self.tree.column(i, anchor=tk.CENTER, width=max(80, 9 * len(header)))
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scroll)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.frame.rowconfigure(0, weight=1)
+        self.frame.columnconfigure(0, weight=1)
+
+        # Fixed item slots the rows scroll through
+        self.slots = [self.tree.insert('', tk.END) for _ in range(min(self.height, len(self.rows)))]
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self.on_wheel)
+        self.refresh()
+
+    def refresh(self):
+        """Writes the visible rows into the item slots and updates the scrollbar"""
+        for slot, row in zip(self.slots, self.rows[self.offset:self.offset + len(self.slots)]):
+            self.tree.item(slot, values=['' if v is None else v for v in row])
+        if self.rows:
+            self.scrollbar.set(self.offset / len(self.rows), (self.offset + len(self.slots)) / len(self.rows))
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(int(offset), len(self.rows) - len(self.slots)))
+        self.refresh()
+
+    def on_scroll(self, action, amount, unit=None):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        if action == tk.MOVETO:
+            self.scroll_to(float(amount) * len(self.rows))
+        else:
+            step = len(self.slots) if unit == tk.PAGES else 1
+            self.scroll_to(self.offset + int(amount) * step)
+
+    def on_wheel(self, event):
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.scroll_to(self.offset - 3)
+        else:
+            self.scroll_to(self.offset + 3)
+        return 'break'
+
+    def sort(self, column):
+        """Sorts by a column (empty cells last), reversing when it is already sorted by it"""
+        self.descending = not self.descending if column == self.sort_column else False
+        self.sort_column = column
+        filled = [row for row in self.rows if row[column] is not None]
+        filled.sort(key=itemgetter(column), reverse=self.descending)
+        self.rows = filled + [row for row in self.rows if row[column] is None]
+        for i, header in enumerate(self.headers):
+            arrow = (' ▼' if self.descending else ' ▲') if i == column else ''
+            self.tree.heading(i, text=header + arrow)
+        self.scroll_to(0)
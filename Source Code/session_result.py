@@ -0,0 +1,111 @@
+import csv
+import os
+import re
+
+import numpy as np
+
+from classification import SCHEMES, classify_codes
+
+COLUMNS = ['frequency', 'volume', 'played', 'heard', 'reaction_time']
+EXCEL_HEADERS = ['Sl. No.', 'Pitch (Frequency Hz)', 'Hearing Level (Volume dB)', 'Hearing Loss Range']
+
+
+class SessionResult:
+    """Responses of one ear stored as numpy columns
+
+    A lightweight stand-in for the DataFrame ``analyse_results`` used to
+    build, so the test itself never has to import pandas. DataFrame and Excel
+    exports import it only when they are called.
+    """
+
+    __slots__ = ('ear', 'frequency', 'volume', 'played', 'heard', '_size')
+
+    def __init__(self, ear, capacity=16):
+        self.ear = ear
+        self.frequency = np.zeros(capacity, dtype=np.int32)
+        self.volume = np.zeros(capacity, dtype=np.int16)
+        self.played = np.zeros(capacity, dtype='datetime64[us]')
+        self.heard = np.zeros(capacity, dtype='datetime64[us]')
+        self._size = 0
+
+    @classmethod
+    def from_rows(cls, rows, ear):
+        """Builds a result from [frequency, volume, played, heard] rows"""
+        result = cls(ear, capacity=max(len(rows), 1))
+        for row in rows:
+            result.append(*row[:4])
+        return result
+
+    @classmethod
+    def read_csv(cls, path, ear=None):
+        """Loads a results CSV written by ``to_csv``; the ear defaults to the one in the file name"""
+        if ear is None:
+            match = re.match(r'results_(left|right)_', os.path.basename(path))
+            ear = match.group(1) if match else 'right'
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = [[int(r['frequency']), int(float(r['volume'])), r['played'].replace(' ', 'T'), r['heard'].replace(' ', 'T')]
+                    for r in csv.DictReader(f)]
+        return cls.from_rows(rows, ear)
+
+    def append(self, frequency, volume, played, heard):
+        """Adds one response, doubling the column capacity when full"""
+        if self._size == len(self.frequency):
+            for name in ('frequency', 'volume', 'played', 'heard'):
+                column = getattr(self, name)
+                grown = np.zeros(2 * len(column), dtype=column.dtype)
+                grown[:self._size] = column
+                setattr(self, name, grown)
+        i = self._size
+        self.frequency[i] = frequency
+        self.volume[i] = volume
+        self.played[i] = np.datetime64(played, 'us')
+        self.heard[i] = np.datetime64(heard, 'us')
+        self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, column):
+        """Column access like a DataFrame: result['volume']"""
+        if column == 'reaction_time':
+            return self.reaction_time
+        if column not in COLUMNS:
+            raise KeyError(column)
+        return getattr(self, column)[:self._size]
+
+    @property
+    def reaction_time(self):
+        """Milliseconds between tone onset and click"""
+        return (self['heard'] - self['played']) // np.timedelta64(1, 'ms')
+
+    def hearing_loss_range(self, scheme='default'):
+        """Band label of every response"""
+        labels = SCHEMES[scheme]['labels']
+        return [labels[code] for code in classify_codes(self['volume'], scheme)]
+
+    def to_frame(self):
+        """Exports the responses as a pandas DataFrame"""
+        import pandas as pd
+
+        return pd.DataFrame({column: self[column] for column in COLUMNS})
+
+    def to_csv(self, path):
+        """Writes the responses as CSV without going through pandas"""
+        played = np.char.replace(np.datetime_as_string(self['played']), 'T', ' ')
+        heard = np.char.replace(np.datetime_as_string(self['heard']), 'T', ' ')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(zip(self['frequency'].tolist(), self['volume'].tolist(),
+                                 played.tolist(), heard.tolist(), self.reaction_time.tolist()))
+
+    def to_excel(self, path, scheme='default'):
+        """Writes the results table as an Excel sheet (needs pandas and openpyxl)"""
+        import pandas as pd
+
+        pd.DataFrame({
+            EXCEL_HEADERS[0]: np.arange(1, len(self) + 1),
+            EXCEL_HEADERS[1]: self['frequency'],
+            EXCEL_HEADERS[2]: self['volume'],
+            EXCEL_HEADERS[3]: self.hearing_loss_range(scheme),
+        }).to_excel(path, index=None)
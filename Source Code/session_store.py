@@ -0,0 +1,137 @@
+import sqlite3
+from datetime import datetime
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    age INTEGER,
+    sex TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT REFERENCES patients (id),
+    started TEXT NOT NULL,
+    protocol TEXT,
+    scheme TEXT
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    ear TEXT NOT NULL,
+    run INTEGER,
+    frequency INTEGER NOT NULL,
+    volume INTEGER NOT NULL,
+    played TEXT NOT NULL,
+    heard TEXT
+);
+CREATE TABLE IF NOT EXISTS thresholds (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    ear TEXT NOT NULL,
+    frequency INTEGER NOT NULL,
+    started TEXT NOT NULL,  -- copy of the session's, so date ranges are answered by the index
+    threshold REAL,
+    n_runs INTEGER,
+    n_responses INTEGER,
+    flag TEXT,
+    PRIMARY KEY (session_id, ear, frequency)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_patient ON sessions (patient_id, started);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+CREATE INDEX IF NOT EXISTS trials_session ON trials (session_id);
+CREATE INDEX IF NOT EXISTS thresholds_frequency ON thresholds (ear, frequency, started, threshold);
+'''
+
+THRESHOLD_COLUMNS = ['patient_id', 'date', 'ear', 'frequency', 'threshold']
+
+
+def _iso(value):
+    # Datetimes always carry microseconds (isoformat() drops them when zero),
+    # so every stored time has the same format
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='microseconds')
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class SessionStore:
+    """Sessions, trials and thresholds of every patient in one SQLite database
+
+    The database runs in WAL mode, so a report can read it while a test is
+    being written, and each session goes in with one transaction of batched
+    inserts. Thresholds are indexed by ear and frequency and sessions by
+    patient and date, so lookups like "all left-ear 4 kHz thresholds this
+    year" stay fast with a clinic's worth of sessions.
+    """
+
+    def __init__(self, path='./sessions.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL a commit survives a crash of the program, just not of the OS
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+
+    def add_session(self, patient_id, started, thresholds, trials=(), protocol=None, scheme=None, age=None, sex=None):
+        """Stores one session in a single transaction and returns its ID
+
+        ``thresholds`` are (ear, frequency, threshold, n_runs, n_responses,
+        flag, ...) rows as returned by ``LiveAnalysis.thresholds`` and
+        ``trials`` the [ear, run, frequency, volume, played, heard] log.
+        """
+        started = _iso(started)
+        with self.connection:
+            if patient_id is not None:
+                self.connection.execute(
+                    'INSERT INTO patients (id, age, sex) VALUES (?, ?, ?) '
+                    'ON CONFLICT (id) DO UPDATE SET age = coalesce(excluded.age, age), sex = coalesce(excluded.sex, sex)',
+                    (patient_id, age, sex))
+            session_id = self.connection.execute(
+                'INSERT INTO sessions (patient_id, started, protocol, scheme) VALUES (?, ?, ?, ?)',
+                (patient_id, started, protocol, scheme)).lastrowid
+            self.connection.executemany(
+                'INSERT INTO thresholds VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((session_id, ear, int(frequency), started, threshold, n_runs, n_responses, flag)
+                 for ear, frequency, threshold, n_runs, n_responses, flag, *_ in thresholds))
+            self.connection.executemany(
+                'INSERT INTO trials VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((session_id, ear, run, int(frequency), int(volume), _iso(played), _iso(heard))
+                 for ear, run, frequency, volume, played, heard in trials))
+        return session_id
+
+    def __len__(self):
+        return self.connection.execute('SELECT count(*) FROM sessions').fetchone()[0]
+
+    def thresholds(self, ear=None, frequency=None, since=None, until=None, patient_id=None):
+        """(patient_id, date, ear, frequency, threshold) rows matching every given filter
+
+        ``since`` is inclusive and ``until`` exclusive; both take dates,
+        datetimes or ISO strings.
+        """
+        filters = [('t.ear = ?', ear), ('t.frequency = ?', frequency), ('t.started >= ?', _iso(since)),
+                   ('t.started < ?', _iso(until)), ('s.patient_id = ?', patient_id)]
+        filters = [(clause, value) for clause, value in filters if value is not None]
+        where = ' AND '.join(clause for clause, _ in filters) or '1'
+        return self.connection.execute(
+            'SELECT s.patient_id, t.started, t.ear, t.frequency, t.threshold '
+            'FROM thresholds t JOIN sessions s ON s.id = t.session_id '
+            f'WHERE t.threshold IS NOT NULL AND {where} ORDER BY s.patient_id, t.started, t.ear, t.frequency',
+            [value for _, value in filters]).fetchall()
+
+    def trials(self, session_id):
+        """[ear, run, frequency, volume, played, heard] log of one session"""
+        return [list(row) for row in self.connection.execute(
+            'SELECT ear, run, frequency, volume, played, heard FROM trials WHERE session_id = ? ORDER BY rowid',
+            (session_id,))]
+
+    def load(self, patient_id=None):
+        """Thresholds as a DataFrame indexed by patient ID and date, as ``threshold_shifts`` takes them"""
+        import pandas as pd
+
+        df = pd.DataFrame(self.thresholds(patient_id=patient_id), columns=THRESHOLD_COLUMNS)
+        df['date'] = pd.to_datetime(df['date'])
+        df['ear'] = df['ear'].astype('category')
+        return df.set_index(['patient_id', 'date']).sort_index()
+
+    def close(self):
+        # Sampled statistics (about a millisecond) let the planner pick the patient or frequency index
+        self.connection.executescript('PRAGMA analysis_limit=400; ANALYZE;')
+        self.connection.close()
@@ -0,0 +1,71 @@
+"""Startup report of the hearing test based on ``python -X importtime``
+
+Runs the test script's module level in a fresh interpreter, then what
+``HearingTest.warm_up`` loads in the background while the instructions are
+shown, and lists the slowest imports of each stage.
+
+Usage: python startup_report.py [-n 15] [--script "Batch_08_Source Code.py"]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, 'Batch_08_Source Code.py')
+
+# Import lines look like "import time:  self [us] |  cumulative | <indent>module"
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+CHILD = '''
+import sys, time, runpy
+t = time.perf_counter()
+runpy.run_path({script!r}, run_name='startup')
+print(f'@@stage {{time.perf_counter() - t}}', file=sys.stderr)
+t = time.perf_counter()
+import pyaudio, audiogram
+from protocol import DEFAULT_PROTOCOL
+from report import REPORT_DPI
+pyaudio.PyAudio().terminate()
+audiogram.warm_up(DEFAULT_PROTOCOL, dpis=(100, REPORT_DPI))
+print(f'@@stage {{time.perf_counter() - t}}', file=sys.stderr)
+'''
+
+STAGES = ['Startup (before the instructions window)', 'Background warm-up (pyaudio, matplotlib, report, templates)']
+
+
+def measure(script=SCRIPT):
+    """Runs the stages under -X importtime; returns [(seconds, [(cumulative_us, module)])] per stage"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD.format(script=script)],
+                          cwd=os.path.dirname(script), capture_output=True, text=True)
+    stages, imports = [], []
+    for line in proc.stderr.splitlines():
+        if line.startswith('@@stage '):
+            stages.append((float(line.split()[1]), imports))
+            imports = []
+            continue
+        match = IMPORT_LINE.match(line)
+        # Only top-level imports: nested ones are included in their parent's cumulative time
+        if match and not match[3]:
+            imports.append((int(match[2]), match[4]))
+    if len(stages) < len(STAGES):
+        raise RuntimeError(f'Startup measurement failed:\n{proc.stderr[-2000:]}')
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report where the hearing test spends its start-up time')
+    parser.add_argument('-n', '--top', type=int, default=15, help='Slowest imports listed per stage')
+    parser.add_argument('--script', default=SCRIPT, help='Hearing test script to measure')
+    args = parser.parse_args()
+
+    for title, (seconds, imports) in zip(STAGES, measure(os.path.abspath(args.script))):
+        print(f'{title}: {seconds * 1000:.0f} ms, {len(imports)} top-level imports')
+        for cumulative, module in sorted(imports, reverse=True)[:args.top]:
+            print(f'  {cumulative / 1000:8.1f} ms  {module}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import numpy as np
+
+from audiogram import audiogram_figure, audiogram_template, bilateral_figure, bilateral_template
+
+FREQUENCIES = [500, 1000, 2000, 3000, 4000, 6000, 8000]
+
+
+def full_draw(fig):
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba())
+
+
+def test_template_matches_full_draw_with_low_high_frequency_thresholds():
+    # Low thresholds at high frequencies lie where a 'best' legend would go
+    volume = [90, 20, 10, 0, -5, 0, -10]
+    template = audiogram_template('right', tuple(FREQUENCIES))
+    expected = full_draw(audiogram_figure(FREQUENCIES, volume, 'right'))
+    assert np.array_equal(template.pixels((FREQUENCIES, volume)), expected)
+
+
+def test_bilateral_template_matches_full_draw():
+    right, left = [20, 15, 10, 0, -5, 0, 30], [10, 10, 40, 40, 40, 5, 0]
+    results = {'right': {'frequency': FREQUENCIES, 'volume': right}, 'left': {'frequency': FREQUENCIES, 'volume': left}}
+    template = bilateral_template(('right', 'left'), FREQUENCIES)
+    expected = full_draw(bilateral_figure(results))
+    assert np.array_equal(template.pixels((FREQUENCIES, right), (FREQUENCIES, left)), expected)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+TRIAL_COLUMNS = ['ear', 'run', 'frequency', 'volume', 'played', 'heard']
+
+# Confidence flags attached to every extracted threshold
+FLAGS = ['ok', 'single_run', 'inconsistent', 'no_response']
+
+
+def trial_frame(trials):
+    """Builds the stimulus/response log from [ear, run, frequency, volume, played, heard] rows
+
+    ``heard`` is the response time, or None when the tone was not heard.
+    """
+    return pd.DataFrame(trials, columns=TRIAL_COLUMNS)
+
+
+def extract_thresholds(trials, min_responses=2):
+    """Computes the threshold per ear and frequency from the full trial log
+
+    The threshold is the lowest level heard on at least ``min_responses``
+    ascending runs and on at least half of the runs that presented it
+    (2 of 3 with the usual three runs). Every result carries a flag:
+
+    - ``ok``: the rule was met
+    - ``single_run``: too few runs for the rule; lowest level heard is used
+    - ``inconsistent``: responses never repeated at one level; lowest level heard is used
+    - ``no_response``: nothing was heard; threshold is NaN
+
+    Extra key columns such as ``session`` or ``patient`` are kept, so large
+    multi-session frames are handled by the same single groupby.
+    """
+    keys = [k for k in trials.columns if k not in TRIAL_COLUMNS] + ['ear', 'frequency']
+    heard = trials['heard']
+    if heard.dtype != bool:
+        heard = heard.notna()
+
+    # One row per key and level: runs that presented it and runs that heard it.
+    # An ascending run presents each level once, so presentations count runs.
+    stats = (trials[keys + ['volume']].assign(heard=heard)
+             .groupby(keys + ['volume'], sort=True, observed=True)
+             .agg(heard=('heard', 'sum'), shown=('heard', 'size')))
+
+    heard_n = stats['heard'].to_numpy()
+    shown = stats['shown'].to_numpy()
+    level = stats.index.get_level_values('volume').to_numpy(dtype=np.float64)
+    key_index = stats.index.droplevel('volume')
+    starts = np.flatnonzero(~key_index.duplicated())
+
+    # Rows are sorted by key then level, so per-key reductions are reduceat's
+    qualified = (heard_n >= min_responses) & (2 * heard_n >= shown)
+    threshold = np.minimum.reduceat(np.where(qualified, level, np.inf), starts)
+    lowest_heard = np.minimum.reduceat(np.where(heard_n > 0, level, np.inf), starts)
+    n_runs = np.maximum.reduceat(shown, starts)
+    n_responses = np.add.reduceat(heard_n, starts)
+
+    flag = np.select(
+        [n_responses == 0, np.isfinite(threshold), n_runs < min_responses],
+        [FLAGS.index('no_response'), FLAGS.index('ok'), FLAGS.index('single_run')],
+        default=FLAGS.index('inconsistent'))
+    threshold = np.where(np.isfinite(threshold), threshold, lowest_heard)
+    threshold[n_responses == 0] = np.nan
+
+    result = key_index[starts].to_frame(index=False)
+    result['threshold'] = threshold
+    result['n_runs'] = n_runs
+    result['n_responses'] = n_responses
+    result['flag'] = pd.Categorical.from_codes(flag, categories=FLAGS)
+    return result
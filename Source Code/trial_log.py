@@ -0,0 +1,158 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from protocol import EARS
+
+MAGIC = b'TRLOG\x01'
+
+# Every record is framed as (payload length, CRC32 of the payload) + payload,
+# so a reader stops cleanly at a record torn by a power cut
+FRAME = struct.Struct('<HI')
+
+# Payloads start with their kind; datetimes are microseconds since 1970-01-01
+# (naive wall-clock time, as the test records it) and -1 means "not heard"
+START = struct.Struct('<Bqh')      # kind, started, repeat; then the UTF-8 protocol path
+TRIAL = struct.Struct('<BBhhihqq')  # kind, ear, step, level, frequency, volume, played, heard
+EAR_DONE = struct.Struct('<BBq')   # kind, ear, finished (names the ear's result files)
+
+START_KIND, TRIAL_KIND, EAR_DONE_KIND = range(3)
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_us(value):
+    return -1 if value is None else (value - EPOCH) // MICROSECOND
+
+
+def _from_us(value):
+    return None if value < 0 else EPOCH + value * MICROSECOND
+
+
+class TrialLog:
+    """Append-only binary log of the trials of a session
+
+    Records are a few dozen bytes and go to the OS straight away, but are
+    only fsync'ed once ``sync_every`` records are pending or the oldest
+    pending record is ``sync_interval`` seconds old, whichever comes first;
+    a timer enforces the deadline even when no further record arrives. A
+    power cut loses at most that batch; the SD card is written once per
+    batch instead of once per trial. ``sync_every=1`` syncs every record.
+    """
+
+    def __init__(self, path, sync_every=8, sync_interval=10.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._file = open(path, 'ab')
+        # Drop a torn tail so new records are not appended after garbage
+        end = valid_length(path)
+        if end < self._file.tell():
+            self._file.truncate(end)
+            self._file.seek(end)
+        if end == 0:
+            self._file.write(MAGIC)
+            self._sync()
+
+    def append(self, payload, sync=False):
+        """Writes one framed record; fsyncs when the batch is full or ``sync`` is set"""
+        with self._lock:
+            self._file.write(FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._file.flush()
+            self.pending += 1
+            if sync or self.pending >= self.sync_every:
+                self._sync()
+            elif self._timer is None:
+                # Deadline of the oldest pending record
+                self._timer = threading.Timer(self.sync_interval, self._on_deadline)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _on_deadline(self):
+        with self._lock:
+            self._timer = None
+            if self.pending and not self._file.closed:
+                self._sync()
+
+    def _sync(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        os.fsync(self._file.fileno())
+        self.pending = 0
+
+    def sync(self):
+        """Forces the pending records to disk"""
+        with self._lock:
+            self._sync()
+
+    def start(self, started, repeat, protocol):
+        self.append(START.pack(START_KIND, _to_us(started), repeat) + (protocol or '').encode('utf-8'), sync=True)
+
+    def trial(self, ear, step, level, frequency, volume, played, heard):
+        self.append(TRIAL.pack(TRIAL_KIND, EARS.index(ear), step, level, frequency, volume,
+                               _to_us(played), _to_us(heard)))
+
+    def ear_done(self, ear, finished):
+        self.append(EAR_DONE.pack(EAR_DONE_KIND, EARS.index(ear), _to_us(finished)), sync=True)
+
+    def close(self):
+        with self._lock:
+            if self.pending:
+                self._sync()
+            self._file.close()
+
+
+def read_frames(path):
+    """Payloads of every intact record, read through a memory map"""
+    if not os.path.exists(path) or os.path.getsize(path) < len(MAGIC):
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        if buffer[:len(MAGIC)] != MAGIC:
+            return
+        offset = len(MAGIC)
+        while offset + FRAME.size <= len(buffer):
+            length, crc = FRAME.unpack_from(buffer, offset)
+            start = offset + FRAME.size
+            payload = buffer[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield payload
+            offset = start + length
+
+
+def valid_length(path):
+    """Bytes of ``path`` up to the end of its last intact record (0 without a valid header)"""
+    if not os.path.exists(path) or os.path.getsize(path) < len(MAGIC):
+        return 0
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return 0
+    return len(MAGIC) + sum(FRAME.size + len(payload) for payload in read_frames(path))
+
+
+def read_log(path):
+    """Yields the records of a trial log as tuples
+
+    - ('start', started, repeat, protocol)
+    - ('trial', ear, step, level, frequency, volume, played, heard)
+    - ('ear_done', ear, finished)
+    """
+    for payload in read_frames(path):
+        kind = payload[0]
+        if kind == TRIAL_KIND:
+            _, ear, step, level, frequency, volume, played, heard = TRIAL.unpack(payload)
+            yield 'trial', EARS[ear], step, level, frequency, volume, _from_us(played), _from_us(heard)
+        elif kind == START_KIND:
+            _, started, repeat = START.unpack_from(payload)
+            yield 'start', _from_us(started), repeat, payload[START.size:].decode('utf-8') or None
+        elif kind == EAR_DONE_KIND:
+            _, ear, finished = EAR_DONE.unpack(payload)
+            yield 'ear_done', EARS[ear], _from_us(finished)